@@ -1,13 +1,19 @@
 import os
+import time
 import logging
+from dataclasses import dataclass, fields
 from typing import List, Optional
 from dotenv import load_dotenv
 
-# Configure logging for this module
+# Pin TZ to the system zone file so glibc doesn't stat() /etc/localtime for every %(asctime)s
+os.environ.setdefault("TZ", ":/etc/localtime")
+if hasattr(time, "tzset"):
+    time.tzset()
+
+# Configure logging once for the whole app. Every app module imports config first, so this is the
+# single place the root handler is installed; basicConfig() is a no-op if a root handler already exists.
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-# Basic config if not configured elsewhere
-if not logger.hasHandlers():
-     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # Load environment variables from .env file
 # It's often good practice to call load_dotenv() early, maybe in main.py or here.
@@ -15,10 +21,13 @@ if not logger.hasHandlers():
 load_dotenv()
 logger.info("Configuration: Loading environment variables.")
 
+# Snapshot the environment once after .env is applied; every setting below is a plain dict lookup.
+_env = dict(os.environ)
+
 
 # --- Gemini Settings ---
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")
+GEMINI_API_KEY = _env.get("GEMINI_API_KEY")
+GEMINI_MODEL_NAME = _env.get("GEMINI_MODEL_NAME")
 
 if not GEMINI_API_KEY:
      logger.error("Configuration FATAL: GEMINI_API_KEY environment variable not set.")
@@ -26,41 +35,68 @@ if not GEMINI_API_KEY:
 
 # --- Environment Setting --- 
 # Controls which database config to use ('local' or 'production')
-ENVIRONMENT: str = os.getenv("ENVIRONMENT").lower()
-if ENVIRONMENT not in ['local', 'production']:
+_VALID_ENVIRONMENTS = frozenset(('local', 'production'))
+# Missing ENVIRONMENT falls back to 'production' instead of crashing on None.lower()
+ENVIRONMENT: str = (_env.get("ENVIRONMENT") or 'production').lower()
+if ENVIRONMENT not in _VALID_ENVIRONMENTS:
     logger.warning(f"Invalid ENVIRONMENT '{ENVIRONMENT}' specified. Defaulting to 'production'.")
     ENVIRONMENT = 'production'
 logger.info(f"Configuration: Running in '{ENVIRONMENT}' environment.")
 
 # --- Database Settings (Relevant variables read based on ENVIRONMENT later) ---
-DATABASE_URL = os.getenv("DATABASE_URL") # Used for 'local'
-DB_USER = os.getenv("DB_USER") # Used for 'production' (and maybe 'local' if DATABASE_URL doesn't contain it)
-DB_PASS = os.getenv("DB_PASS") # Used for 'production' (and maybe 'local')
-DB_NAME = os.getenv("DB_NAME") # Used for 'production' (and maybe 'local')
-INSTANCE_CONNECTION_NAME = os.getenv("INSTANCE_CONNECTION_NAME") # Used for 'production'
+DATABASE_URL = _env.get("DATABASE_URL") # Used for 'local'
+DB_USER = _env.get("DB_USER") # Used for 'production' (and maybe 'local' if DATABASE_URL doesn't contain it)
+DB_PASS = _env.get("DB_PASS") # Used for 'production' (and maybe 'local')
+DB_NAME = _env.get("DB_NAME") # Used for 'production' (and maybe 'local')
+INSTANCE_CONNECTION_NAME = _env.get("INSTANCE_CONNECTION_NAME") # Used for 'production'
+
+# --- Connection Pool Settings (shared by every engine) ---
+# Tuning guide: the limits apply per worker process (Procfile runs 4 gunicorn workers).
+# Start DB_POOL_SIZE near the number of requests one worker serves concurrently, and keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the database's max_connections.
+# If requests wait on DB_POOL_TIMEOUT, raise the pool size before raising the overflow.
+# DB_POOL_RECYCLE is an hour: every new Cloud SQL connection pays for TLS and an auth check.
+DB_POOL_SIZE = int(_env.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(_env.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(_env.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(_env.get("DB_POOL_RECYCLE", 3600))
 
 # --- JWT Settings ---
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change_this_super_secret_key_in_production")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+JWT_SECRET_KEY = _env.get("JWT_SECRET_KEY", "change_this_super_secret_key_in_production")
+ALGORITHM = _env.get("ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(_env.get("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+# --- Password Hashing ---
+# bcrypt work factor for newly created hashes; existing hashes keep the cost
+# they were created with.
+BCRYPT_ROUNDS = int(_env.get("BCRYPT_ROUNDS", 12))
 
 # --- News data api ---
-NEWS_API_URL = os.getenv("NEWS_API_URL")
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-NEWS_COUNTRY = os.getenv("NEWS_COUNTRY")
-PRIORITY_DOMAIN = os.getenv("PRIORITY_DOMAIN")
+NEWS_API_URL = _env.get("NEWS_API_URL")
+NEWS_API_KEY = _env.get("NEWS_API_KEY")
+NEWS_COUNTRY = _env.get("NEWS_COUNTRY")
+PRIORITY_DOMAIN = _env.get("PRIORITY_DOMAIN")
 
 
 # --- GNEWS API ---
-GNEWS_API_URL = os.getenv("GNEWS_API_URL")
-GNEWS_API_KEY = os.getenv("GNEWS_API_KEY")
-GNEWS_COUNTRY = os.getenv("GNEWS_COUNTRY")
+GNEWS_API_URL = _env.get("GNEWS_API_URL")
+GNEWS_API_KEY = _env.get("GNEWS_API_KEY")
+GNEWS_COUNTRY = _env.get("GNEWS_COUNTRY")
+
+# --- Article Processing ---
+# How many articles are fetched and summarized at once per feed run; bounds load on
+# the news sites and the Gemini quota.
+SUMMARY_MAX_CONCURRENCY = int(_env.get("SUMMARY_MAX_CONCURRENCY", 10))
+# How many articles go into one Gemini request; each request returns a JSON array of summaries.
+SUMMARY_BATCH_SIZE = int(_env.get("SUMMARY_BATCH_SIZE", 8))
+# Upper bound on Gemini requests in flight across both feeds, to stay under the API rate limit.
+GEMINI_MAX_CONCURRENCY = int(_env.get("GEMINI_MAX_CONCURRENCY", 4))
 
 # --- Apple Sign In --- 
-APPLE_BUNDLE_ID: Optional[str] = os.getenv("APPLE_BUNDLE_ID")
-APPLE_TEAM_ID: Optional[str] = os.getenv("APPLE_TEAM_ID")
-APPLE_KEY_ID: Optional[str] = os.getenv("APPLE_KEY_ID")
-APPLE_PRIVATE_KEY: Optional[str] = os.getenv("APPLE_PRIVATE_KEY")
+APPLE_BUNDLE_ID: Optional[str] = _env.get("APPLE_BUNDLE_ID")
+APPLE_TEAM_ID: Optional[str] = _env.get("APPLE_TEAM_ID")
+APPLE_KEY_ID: Optional[str] = _env.get("APPLE_KEY_ID")
+APPLE_PRIVATE_KEY: Optional[str] = _env.get("APPLE_PRIVATE_KEY")
 
 # Validate required Apple credentials for token exchange/refresh
 apple_signin_configured = True
@@ -75,3 +111,44 @@ if not all([APPLE_BUNDLE_ID, APPLE_TEAM_ID, APPLE_KEY_ID, APPLE_PRIVATE_KEY]):
 # if not APPLE_BUNDLE_ID:
 #     logger.warning("APPLE_BUNDLE_ID environment variable not set. Apple Sign In verification will fail.")
 
+
+
+# --- Settings Snapshot ---
+# Immutable, picklable view of the values above, exposed as config.settings. Each field is
+# read from the module-level name of the same name upper-cased, so the two cannot drift;
+# a renamed setting without a matching field change fails here at import.
+@dataclass(frozen=True, slots=True)
+class Settings:
+    gemini_api_key: Optional[str]
+    gemini_model_name: Optional[str]
+    environment: str
+    database_url: Optional[str]
+    db_user: Optional[str]
+    db_pass: Optional[str]
+    db_name: Optional[str]
+    instance_connection_name: Optional[str]
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: int
+    db_pool_recycle: int
+    jwt_secret_key: str
+    algorithm: str
+    access_token_expire_minutes: int
+    bcrypt_rounds: int
+    news_api_url: Optional[str]
+    news_api_key: Optional[str]
+    news_country: Optional[str]
+    priority_domain: Optional[str]
+    gnews_api_url: Optional[str]
+    gnews_api_key: Optional[str]
+    gnews_country: Optional[str]
+    summary_max_concurrency: int
+    summary_batch_size: int
+    gemini_max_concurrency: int
+    apple_bundle_id: Optional[str]
+    apple_team_id: Optional[str]
+    apple_key_id: Optional[str]
+    apple_private_key: Optional[str]
+
+
+settings = Settings(**{field.name: globals()[field.name.upper()] for field in fields(Settings)})
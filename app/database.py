@@ -1,143 +1,194 @@
 import os
 import logging
-import json
-from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import AsyncGenerator
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.orm import declarative_base
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
 
 # --- Google Cloud SQL Specific Imports (only needed for 'production' environment) ---
-from google.cloud.sql.connector import Connector, IPTypes
-from google.oauth2 import service_account
-import asyncpg
+# Connector/IPTypes are imported lazily inside _create_production_engine() so local runs never load them.
+# asyncpg itself is loaded by SQLAlchemy's dialect when the engine connects.
+if TYPE_CHECKING:
+    import asyncpg
 
 # --- Import App Config FIRST --- 
-from app import config # Reads .env and determines ENVIRONMENT
+from app import config # Reads .env, configures logging and determines ENVIRONMENT
+from app.db_constants import DIALECT_URL, DRIVER
 
-# --- Basic Logging Setup ---
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Define Shared Declarative Base --- 
 # All models should inherit from this Base
 Base = declarative_base()
 
-# --- Initialize Variables --- 
-engine = None
-AsyncSessionFactory = None
+# --- Lazily Initialized Variables ---
+# Populated on first use by get_session_factory(); nothing connects at import time.
+engine: Optional[AsyncEngine] = None
+AsyncSessionFactory: Optional[async_sessionmaker[AsyncSession]] = None
+
+# Pool settings shared by the local and production engines.
+# pool_pre_ping checks a connection on checkout so stale ones are replaced instead of failing the query.
+# pool_use_lifo hands out the most recently returned connection, so idle extras age out instead of staying warm.
+_POOL_OPTIONS = dict(
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+)
+
+# Set once the first pooled connection succeeds so later refills log at DEBUG only
+_logged_first_conn = False
+
+# Cloud SQL Connector, owned by the process that created it.
+# Its background refresh tasks and channels are not fork-safe, so a forked worker builds its own.
+_connector = None
+_connector_pid: Optional[int] = None
+
+
+def _get_connector():
+    """Returns this process's Cloud SQL Connector, creating it on first use (or after a fork)."""
+    global _connector, _connector_pid
+    pid = os.getpid()
+    if _connector is None or _connector_pid != pid:
+        from google.cloud.sql.connector import Connector
+        logger.info("DATABASE_CONFIG: Attempting to initialize PRODUCTION connector.")
+        # Initialize connector without explicit credentials
+        # It will use Application Default Credentials when running on GCP
+        _connector = Connector()
+        _connector_pid = pid
+        logger.info(f"Cloud SQL Connector initialized successfully for PRODUCTION environment (using ADC, pid {pid}).")
+    return _connector
 
-# === Log the environment value right before the conditional ===
-logger.info(f"DATABASE_CONFIG: Checking environment. config.ENVIRONMENT = '{config.ENVIRONMENT}'")
-logger.info(f"DATABASE_CONFIG: Checking presence of config.DATABASE_URL: {bool(config.DATABASE_URL)}")
 
-# === Environment-Specific Configuration - MODIFIED LOGIC ===
-# Prioritize DATABASE_URL for local setup, regardless of ENVIRONMENT value
-if config.DATABASE_URL and config.ENVIRONMENT == 'local': # Check both for clarity, but DATABASE_URL takes precedence
-    logger.info("DATABASE_CONFIG: Entering LOCAL configuration block (DATABASE_URL is set).")
+def _create_local_engine() -> AsyncEngine:
+    """Builds the engine for LOCAL runs from DATABASE_URL."""
     logger.info("--- Configuring for LOCAL environment (DATABASE_URL) --- ")
     DATABASE_URL_LOCAL = config.DATABASE_URL # Use DATABASE_URL for local
-    # if not DATABASE_URL_LOCAL: # Already checked above
-    #     logger.error("FATAL: DATABASE_URL environment variable not set for local environment.")
-    #     raise ValueError("DATABASE_URL is required for local environment.")
 
     try:
         logger.info(f"DATABASE_CONFIG: Attempting to create LOCAL engine with URL: {DATABASE_URL_LOCAL[:20]}...")
         # Assume DATABASE_URL contains all necessary info (user, pass, host, db)
-        engine = create_async_engine(DATABASE_URL_LOCAL, echo=False, future=True, pool_recycle=1800)
-        AsyncSessionFactory = sessionmaker(
-            engine, class_=AsyncSession, expire_on_commit=False
-        )
+        local_engine = create_async_engine(DATABASE_URL_LOCAL, echo=False, future=True, **_POOL_OPTIONS)
         # Log db host/name if possible, hiding credentials
         log_url_part = DATABASE_URL_LOCAL.split('@')[-1] if '@' in DATABASE_URL_LOCAL else DATABASE_URL_LOCAL
         logger.info(f"Local database configured using DATABASE_URL ending in: ...{log_url_part}")
+        return local_engine
     except Exception as e:
         logger.error(f"Error configuring local database engine/session using DATABASE_URL: {e}", exc_info=True)
         raise
 
-elif config.ENVIRONMENT == 'production':
-    logger.info("DATABASE_CONFIG: Entering PRODUCTION configuration block (ENVIRONMENT=production and DATABASE_URL not set/prioritized).")
+
+def _create_production_engine() -> AsyncEngine:
+    """Builds the engine for PRODUCTION runs via the Cloud SQL Connector (ADC)."""
     logger.info("--- Configuring for PRODUCTION environment (Google Cloud SQL Connector + ADC) ---")
-    # --- Load Production Environment Variables --- 
+    # Deferred so the connector's gRPC/google-auth import chain is only paid when production is actually used
+    from google.cloud.sql.connector import IPTypes
+
     db_user = config.DB_USER
     db_pass = config.DB_PASS
     db_name = config.DB_NAME
     instance_connection_name = config.INSTANCE_CONNECTION_NAME
-    # gcp_sa_key_content is no longer needed
-
-    # --- Validate Production Variables (excluding GCP_SA_KEY) ---
-    if not all([db_user, db_pass, db_name, instance_connection_name]):
-        missing_vars = [
-            var_name for var_name, var_value in {
-                "DB_USER": db_user, "DB_PASS": db_pass, "DB_NAME": db_name,
-                "INSTANCE_CONNECTION_NAME": instance_connection_name,
-                # Removed GCP_SA_KEY from check
-            }.items() if not var_value
-        ]
-        error_message = f"FATAL: Missing environment variables for PRODUCTION (Cloud SQL) connection: {missing_vars}"
-        logger.error(error_message)
-        raise ValueError(error_message)
-
-    logger.info(f"Production DB config loaded for instance: {instance_connection_name}, db: {db_name}")
 
     # --- Set up Cloud SQL Connector (using ADC) --- 
     try:
-        logger.info("DATABASE_CONFIG: Attempting to initialize PRODUCTION connector.")
-        # Initialize connector without explicit credentials
-        # It will use Application Default Credentials when running on GCP
-        connector = Connector()
-        logger.info("Cloud SQL Connector initialized successfully for PRODUCTION environment (using ADC).")
-
-        async def getconn_prod() -> asyncpg.Connection:
-            logger.info("DATABASE_CONFIG: Attempting PRODUCTION connection via getconn_prod.")
+        # The connector itself is created by the first getconn_prod call, inside the running loop
+        async def getconn_prod() -> "asyncpg.Connection":
+            global _logged_first_conn
             # The connector instance handles authentication automatically
-            conn = await connector.connect_async(
-                instance_connection_name, "asyncpg", user=db_user,
+            conn = await _get_connector().connect_async(
+                instance_connection_name, DRIVER, user=db_user,
                 password=db_pass, db=db_name, ip_type=IPTypes.PUBLIC # Assuming Public IP, adjust if needed
                 # enable_iam_auth=True # Set this if using IAM DB Authentication
             )
+            # Runs on every pool refill, so only the first successful connection is logged at INFO
+            if not _logged_first_conn:
+                logger.info(f"DATABASE_CONFIG: First PRODUCTION connection established to {instance_connection_name}.")
+                _logged_first_conn = True
+            else:
+                logger.debug("DATABASE_CONFIG: PRODUCTION connection established via getconn_prod.")
             return conn
 
-        engine = create_async_engine(
-            "postgresql+asyncpg://", async_creator=getconn_prod,
-            echo=False, future=True, pool_recycle=1800
-        )
-        AsyncSessionFactory = sessionmaker(
-            engine, class_=AsyncSession, expire_on_commit=False
+        prod_engine = create_async_engine(
+            DIALECT_URL, async_creator=getconn_prod,
+            echo=False, future=True, **_POOL_OPTIONS
         )
         logger.info("PRODUCTION database configured using Cloud SQL Connector.")
+        return prod_engine
 
-    # Remove JSONDecodeError handling as it's no longer relevant
     except Exception as e:
         logger.exception(f"FAILED to configure PRODUCTION database via Cloud SQL Connector: {e}")
         raise
 
-else:
-    # This case means ENVIRONMENT was not 'production', and DATABASE_URL was also not set.
-    error_message = f"FATAL: Database configuration failed. ENVIRONMENT is '{config.ENVIRONMENT}' but DATABASE_URL is not set."
-    logger.error(error_message)
-    raise ValueError(error_message)
+
+def _validate_local_config() -> None:
+    """LOCAL runs need DATABASE_URL, which carries user, password, host and db."""
+    if not config.DATABASE_URL:
+        error_message = f"FATAL: Database configuration failed. ENVIRONMENT is '{config.ENVIRONMENT}' but DATABASE_URL is not set."
+        logger.error(error_message)
+        raise ValueError(error_message)
+    logger.info("DATABASE_CONFIG: Selected LOCAL configuration (DATABASE_URL is set).")
+
+
+def _validate_production_config() -> None:
+    """PRODUCTION runs need the Cloud SQL credentials and instance name."""
+    _REQUIRED_PRODUCTION_VARS = (
+        ("DB_USER", config.DB_USER),
+        ("DB_PASS", config.DB_PASS),
+        ("DB_NAME", config.DB_NAME),
+        ("INSTANCE_CONNECTION_NAME", config.INSTANCE_CONNECTION_NAME),
+    )
+    missing_vars = [var_name for var_name, var_value in _REQUIRED_PRODUCTION_VARS if not var_value]
+    if missing_vars:
+        error_message = f"FATAL: Missing environment variables for PRODUCTION (Cloud SQL) connection: {missing_vars}"
+        logger.error(error_message)
+        raise ValueError(error_message)
+    logger.info(f"DATABASE_CONFIG: Selected PRODUCTION configuration for instance: {config.INSTANCE_CONNECTION_NAME}, db: {config.DB_NAME}")
+
+
+# === Environment-Specific Configuration ===
+# config.ENVIRONMENT is always 'local' or 'production', so one lookup picks the validator and builder.
+# Only the (cheap) validation happens at import; the engine itself is built on first use.
+_ENGINE_FACTORIES = {
+    'local': (_validate_local_config, _create_local_engine),
+    'production': (_validate_production_config, _create_production_engine),
+}
+
+logger.info(f"DATABASE_CONFIG: Checking environment. config.ENVIRONMENT = '{config.ENVIRONMENT}'")
+_validate_config, _create_engine = _ENGINE_FACTORIES[config.ENVIRONMENT]
+_validate_config()
+
+
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """
+    Returns the shared session factory, creating the engine on first call.
+    Engine creation does not await, so concurrent first callers cannot interleave here.
+    """
+    global engine, AsyncSessionFactory
+    if AsyncSessionFactory is None:
+        engine = _create_engine()
+        AsyncSessionFactory = async_sessionmaker(
+            engine, expire_on_commit=False, autoflush=False
+        )
+    return AsyncSessionFactory
 
 # === Shared DB Session Dependency ===
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency function yields an async SQLAlchemy session based on the environment.
-    Uses session.begin() for automatic commit/rollback.
+    Uses AsyncSessionFactory.begin() for automatic commit/rollback.
     """
-    if not AsyncSessionFactory:
-         logger.error("DATABASE_CONFIG: get_db_session called but AsyncSessionFactory is None!")
-         raise RuntimeError("Database session factory not initialized. Check environment configuration.")
+    session_factory = get_session_factory()
 
-    session: AsyncSession | None = None
     try:
-        # Using session.begin() for automatic commit/rollback
-        async with AsyncSessionFactory() as session:
-            async with session.begin():
-                yield session
+        # factory.begin() opens the session and its transaction in one context:
+        # commit on success, rollback on exception, close on exit.
+        async with session_factory.begin() as session:
+            yield session
     except Exception:
         # Logger adapted from original file's finally block
         logger.exception("Exception occurred during DB session usage, transaction likely rolled back by session.begin().")
         raise # Re-raise after logging
-    # No explicit close needed when using AsyncSessionFactory context manager
 
 
 # Make sure models import Base from here: from app.database import Base
@@ -1,54 +1,51 @@
-import os
 import logging
-from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
 from typing import AsyncGenerator
 
-# Load environment variables from .env file
-load_dotenv()
+from app import config # Reads .env and configures logging
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = config.DATABASE_URL
 if not DATABASE_URL:
-    logging.error("FATAL: DATABASE_URL environment variable not set.")
+    logger.error("FATAL: DATABASE_URL environment variable not set.")
     raise ValueError("Please set the DATABASE_URL in your .env file.")
 
-logging.info(f"Database URL loaded: {DATABASE_URL.split('@')[-1]}")  # Log DB host/name, hide credentials
+logger.info(f"Database URL loaded: {DATABASE_URL.split('@')[-1]}")  # Log DB host/name, hide credentials
 
 try:
     # Create the async engine
     # echo=False is recommended for production to avoid excessive logging
-    engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+    engine = create_async_engine(
+        DATABASE_URL, echo=False, future=True,
+        pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT, pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True, pool_use_lifo=True
+    )
 
     # Create a configured "Session" class
     # expire_on_commit=False prevents attributes from being expired after commit.
-    AsyncSessionFactory = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
+    AsyncSessionFactory = async_sessionmaker(
+        engine, expire_on_commit=False, autoflush=False
     )
 
     # Base class for declarative models
     Base = declarative_base()
-    logging.info("Database engine and session factory created successfully.")
+    logger.info("Database engine and session factory created successfully.")
 
 except Exception as e:
-    logging.error(f"Error creating database engine or session factory: {e}")
+    logger.error(f"Error creating database engine or session factory: {e}")
     raise  # Re-raise the exception to prevent app startup
 
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency function that yields an async SQLAlchemy session
-    with automatic transaction commit/rollback using session.begin().
+    with automatic transaction commit/rollback using AsyncSessionFactory.begin().
     """
-    async with AsyncSessionFactory() as session:
-        # session.begin() starts a transaction and automatically
-        # commits if the block succeeds, or rolls back if an exception occurs.
-        async with session.begin():
-            try:
-                yield session
-            except Exception:
-                # The rollback is handled automatically by session.begin()
-                # context manager on exception. We just need to re-raise
-                # so FastAPI knows an error occurred.
-                raise
-        # Session is automatically closed by the outer 'async with AsyncSessionFactory()'
+    # AsyncSessionFactory.begin() opens the session and starts a transaction in one
+    # context: it commits if the block succeeds, rolls back if an exception occurs
+    # (which is then re-raised so FastAPI knows an error occurred), and closes the session.
+    async with AsyncSessionFactory.begin() as session:
+        yield session
@@ -0,0 +1,7 @@
+# Shared database string constants, defined once and imported by the database modules.
+
+# SQLAlchemy URL used when connections come from the Cloud SQL Connector (async_creator)
+DIALECT_URL = "postgresql+asyncpg://"
+
+# Driver name handed to Connector.connect_async
+DRIVER = "asyncpg"
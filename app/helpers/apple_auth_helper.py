@@ -1,41 +1,188 @@
+import asyncio
+import hashlib
+import hmac
 import logging
+import re
 import time
-from typing import Dict, Any, Optional
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
 import httpx
-from jose import jwt, jwk
-from jose.exceptions import JOSEError
+import orjson
+import jwt
+from cryptography.hazmat.primitives import serialization
+from jwt.algorithms import RSAAlgorithm
+from jwt.utils import base64url_decode, base64url_encode
 
 from app import config # For APPLE_BUNDLE_ID
 from fastapi import HTTPException, status
-import datetime
 
 logger = logging.getLogger(__name__)
 
 # --- Apple Public Key Caching --- 
 APPLE_PUBLIC_KEYS_URL = "https://appleid.apple.com/auth/keys"
 # Simple in-memory cache. Consider Redis/Memcached for production.
-_apple_public_keys: Optional[Dict[str, Any]] = None
+_apple_public_keys: Optional[Dict[str, Any]] = None # kid -> RSA public key object
 _apple_keys_last_fetched: float = 0
-_apple_keys_cache_ttl: int = 3600 # Cache for 1 hour
+_APPLE_KEYS_DEFAULT_TTL: int = 3600 # Cache for 1 hour when Apple sends no freshness headers
+_apple_keys_cache_ttl: int = _APPLE_KEYS_DEFAULT_TTL # Updated from Cache-Control/Expires on each fetch
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+# Single-flight guard: only one coroutine refreshes the keys, concurrent callers wait for its result
+_apple_keys_lock = asyncio.Lock()
+
+# --- Identity Token Verification Settings ---
+APPLE_ISSUER = "https://appleid.apple.com"
+# Explicit decode options, built once: signature, audience, issuer and time claims are always checked
+_APPLE_DECODE_OPTIONS = {
+    "verify_signature": True,
+    "verify_aud": True,
+    "verify_iss": True,
+    "verify_exp": True,
+    "verify_iat": True,
+    "verify_nbf": True,
+}
+# Tolerated clock skew for exp/iat/nbf; PyJWT rejects an iat even one second in the future otherwise
+_APPLE_CLOCK_LEEWAY_SECONDS = 60
+# Claim failures reported as "Invalid token claims" (expiry is handled separately)
+_APPLE_CLAIMS_ERRORS = (
+    jwt.InvalidAudienceError,
+    jwt.InvalidIssuerError,
+    jwt.ImmatureSignatureError,
+    jwt.InvalidIssuedAtError,
+    jwt.MissingRequiredClaimError,
+)
+
+
+def _unverified_header(token: str) -> Dict[str, Any]:
+    """
+    Decodes only the JWT header segment (no signature check) to read the key ID.
+    Raises ValueError if the segment is not a base64url-encoded JSON object.
+    """
+    header_segment = token.split('.', 1)[0]
+    header = orjson.loads(base64url_decode(header_segment.encode('ascii')))
+    if not isinstance(header, dict):
+        raise ValueError("JWT header is not a JSON object")
+    return header
 
-async def _get_apple_public_keys() -> Dict[str, Any]:
-    """Fetches Apple's public keys, with simple caching."""
-    global _apple_public_keys, _apple_keys_last_fetched
-    now = time.time()
-    if _apple_public_keys and (now - _apple_keys_last_fetched < _apple_keys_cache_ttl):
+
+def _verify_at_hash(payload: Dict[str, Any], access_token: Optional[str]) -> None:
+    """
+    Checks the id_token's at_hash claim against the access token issued with it
+    (left half of the SHA-256 digest, base64url-encoded, per OpenID Connect for RS256).
+    PyJWT does not do this itself.
+    """
+    at_hash = payload.get('at_hash')
+    if not at_hash:
+        return
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Invalid token claims: no access_token provided to compare against at_hash claim.")
+    digest = hashlib.sha256(access_token.encode('ascii')).digest()
+    expected_at_hash = base64url_encode(digest[:len(digest) // 2]).decode('ascii')
+    if not hmac.compare_digest(expected_at_hash, at_hash):
+        raise HTTPException(status_code=401, detail="Invalid token claims: at_hash does not match access_token.")
+
+
+# --- Verified Identity Token Cache ---
+# Maps (token, access_token, expected_nonce) -> (token exp, Apple user ID) for tokens that passed
+# full verification, so a repeat of the same token skips the RS256 check until it expires.
+# Failed verifications are never cached. Least recently used entries are evicted past the cap.
+_verified_token_cache: "OrderedDict[Tuple[str, Optional[str], Optional[str]], Tuple[float, str]]" = OrderedDict()
+_verified_token_cache_max_size: int = 10000
+
+# --- Shared HTTP Client ---
+# One pooled client for all calls to appleid.apple.com so keep-alive connections are reused
+# instead of paying a new TCP+TLS handshake per key fetch / token exchange.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Returns the shared Apple HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Closes the shared Apple HTTP client. Called on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _keys_ttl_from_headers(headers: httpx.Headers) -> int:
+    """
+    Derives the JWKS cache lifetime from the response headers:
+    Cache-Control max-age first, then Expires, else the default TTL.
+    """
+    match = _MAX_AGE_RE.search(headers.get('cache-control', ''))
+    if match:
+        return int(match.group(1))
+    expires = headers.get('expires')
+    if expires:
+        try:
+            expires_at = parsedate_to_datetime(expires)
+            if expires_at.tzinfo is None:
+                # '-0000' or zone-less dates parse as naive; HTTP dates are always UTC
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            return max(0, int(expires_at.timestamp() - time.time()))
+        except (TypeError, ValueError):
+            logger.debug(f"Ignoring unparseable Expires header on Apple keys response: {expires!r}")
+    return _APPLE_KEYS_DEFAULT_TTL
+
+
+def _cached_apple_keys(required_kid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Returns the cached keys if fresh (and containing required_kid, when given), else None."""
+    if not _apple_public_keys or (time.time() - _apple_keys_last_fetched >= _apple_keys_cache_ttl):
+        return None
+    if required_kid is not None and required_kid not in _apple_public_keys:
+        return None
+    return _apple_public_keys
+
+
+async def _get_apple_public_keys(required_kid: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fetches Apple's public keys, with simple caching.
+    When required_kid is given and missing from the cache (key rotation), the keys are refetched.
+    Refreshes are single-flight: concurrent callers share one request to Apple.
+    """
+    cached_keys = _cached_apple_keys(required_kid)
+    if cached_keys is not None:
         logger.debug("Using cached Apple public keys.")
-        return _apple_public_keys
+        return cached_keys
+
+    async with _apple_keys_lock:
+        # Another coroutine may have refreshed the keys while we waited for the lock
+        cached_keys = _cached_apple_keys(required_kid)
+        if cached_keys is not None:
+            return cached_keys
+        return await _fetch_apple_public_keys()
+
+
+async def _fetch_apple_public_keys() -> Dict[str, Any]:
+    """Downloads Apple's JWKS and replaces the cache. Callers must hold _apple_keys_lock."""
+    global _apple_public_keys, _apple_keys_last_fetched, _apple_keys_cache_ttl
+    now = time.time()
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(APPLE_PUBLIC_KEYS_URL)
-            response.raise_for_status()
-            jwks = response.json()
-            _apple_public_keys = {key['kid']: key for key in jwks.get('keys', [])}
-            _apple_keys_last_fetched = now
-            logger.info(f"Fetched and cached Apple public keys (found {len(_apple_public_keys)} keys).")
-            return _apple_public_keys
+        response = await _get_client().get(APPLE_PUBLIC_KEYS_URL)
+        response.raise_for_status()
+        jwks = orjson.loads(response.content)
+        # Build each RSA key object once here so verification doesn't rebuild it per token
+        _apple_public_keys = {
+            key['kid']: RSAAlgorithm.from_jwk(key) for key in jwks.get('keys', [])
+        }
+        _apple_keys_last_fetched = now
+        _apple_keys_cache_ttl = _keys_ttl_from_headers(response.headers)
+        logger.debug("Fetched and cached Apple public keys (found %d keys, TTL %ss).",
+                     len(_apple_public_keys), _apple_keys_cache_ttl)
+        return _apple_public_keys
     except Exception as e:
         logger.error(f"Failed to fetch or cache Apple public keys: {e}", exc_info=True)
         # If cache exists but is stale, return stale keys? Or raise? Let's raise for now.
@@ -64,43 +211,49 @@ async def verify_apple_identity_token(
     Raises:
         HTTPException: If verification fails.
     """
+    cache_key = (token, access_token, expected_nonce)
+    cached = _verified_token_cache.get(cache_key)
+    if cached:
+        if cached[0] > time.time():
+            _verified_token_cache.move_to_end(cache_key)
+            logger.debug("Using cached verification result for Apple identity token.")
+            return cached[1]
+        del _verified_token_cache[cache_key]
+
     try:
         # 1. Decode header to get Key ID (kid)
-        unverified_header = jwt.get_unverified_header(token)
+        try:
+            unverified_header = _unverified_header(token)
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Malformed token header.")
         kid = unverified_header.get('kid')
         if not kid:
             raise HTTPException(status_code=401, detail="Token missing key ID (kid).")
 
         # 2. Fetch Apple Public Keys
         apple_keys = await _get_apple_public_keys()
-        public_key_data = apple_keys.get(kid)
-        if not public_key_data:
-            # Maybe keys rotated? Force refresh cache once.
+        public_key = apple_keys.get(kid)
+        if not public_key:
+            # Maybe keys rotated? Refresh once (shared with any concurrent callers missing the same kid).
             logger.warning(f"Key ID '{kid}' not found in cached Apple keys. Forcing refresh.")
-            global _apple_keys_last_fetched
-            _apple_keys_last_fetched = 0 # Invalidate cache
-            apple_keys = await _get_apple_public_keys()
-            public_key_data = apple_keys.get(kid)
-            if not public_key_data:
+            apple_keys = await _get_apple_public_keys(required_kid=kid)
+            public_key = apple_keys.get(kid)
+            if not public_key:
                  raise HTTPException(status_code=401, detail=f"Key ID '{kid}' not found in Apple public keys.")
 
-        # 3. Construct public key from JWK data
-        public_key = jwk.construct(public_key_data)
-
-        # 4. Decode and Verify Token
-        audience = config.APPLE_BUNDLE_ID
-        issuer = "https://appleid.apple.com"
-
+        # 3. Decode and Verify Token (public key object is cached)
         payload = jwt.decode(
             token,
-            public_key.to_pem().decode('utf-8'),
+            public_key,
             algorithms=["RS256"],
-            audience=audience,
-            issuer=issuer,
-            access_token=access_token
+            options=_APPLE_DECODE_OPTIONS,
+            leeway=_APPLE_CLOCK_LEEWAY_SECONDS,
+            audience=config.APPLE_BUNDLE_ID,
+            issuer=APPLE_ISSUER
         )
+        _verify_at_hash(payload, access_token)
 
-        # 5. Validate Claims
+        # 4. Validate Claims
         apple_user_id = payload.get('sub')
         if not apple_user_id:
             raise HTTPException(status_code=401, detail="Token 'sub' (user ID) claim missing.")
@@ -114,17 +267,22 @@ async def verify_apple_identity_token(
             if token_nonce != expected_nonce: # Adjust if client sends hash
                 raise HTTPException(status_code=401, detail="Invalid 'nonce'.")
 
-        logger.info(f"Successfully verified Apple identity token for user: {apple_user_id}")
+        logger.debug("Successfully verified Apple identity token for user: %s", apple_user_id)
+        token_exp = payload.get('exp')
+        if token_exp:
+            _verified_token_cache[cache_key] = (float(token_exp), apple_user_id)
+            if len(_verified_token_cache) > _verified_token_cache_max_size:
+                _verified_token_cache.popitem(last=False)
         return apple_user_id
 
     except jwt.ExpiredSignatureError:
         logger.warning("Apple identity token has expired.")
         raise HTTPException(status_code=401, detail="Apple token expired.")
-    except jwt.JWTClaimsError as e:
+    except _APPLE_CLAIMS_ERRORS as e:
         logger.warning(f"Apple identity token claims error: {e}")
         raise HTTPException(status_code=401, detail=f"Invalid token claims: {e}")
-    except JOSEError as e:
-        logger.error(f"JOSE error verifying Apple token: {e}", exc_info=True)
+    except jwt.PyJWTError as e:
+        logger.error(f"JWT error verifying Apple token: {e}", exc_info=True)
         raise HTTPException(status_code=401, detail="Invalid Apple token signature or structure.")
     except HTTPException as http_exc: # Re-raise specific HTTP exceptions
         raise http_exc
@@ -133,16 +291,49 @@ async def verify_apple_identity_token(
         raise HTTPException(status_code=500, detail="Could not verify Apple token.") 
 
 
+# --- Apple Signing Key ---
+# Parsed once at import so each client secret is signed with a ready key object
+# instead of re-parsing the PEM on every token exchange.
+def _load_apple_private_key():
+    """Loads APPLE_PRIVATE_KEY (with escaped newlines restored) as a key object, or None if unusable."""
+    if not config.apple_signin_configured:
+        return None
+    try:
+        private_key_pem = config.APPLE_PRIVATE_KEY.replace("\\n", "\n")
+        return serialization.load_pem_private_key(private_key_pem.encode('utf-8'), password=None)
+    except Exception as e:
+        logger.error(f"Failed to load APPLE_PRIVATE_KEY; client secret generation will fail: {e}", exc_info=True)
+        return None
+
+
+_apple_private_key = _load_apple_private_key()
+
+
+# --- Client Secret Caching ---
+# The signed client secret is valid for 10 minutes; reuse it until it is within the skew of expiring.
+# Signing never awaits, so concurrent coroutines cannot race on this cache.
+# Times are integer epoch seconds, which is what the JWT iat/exp claims hold anyway.
+_cached_client_secret: Optional[Tuple[str, int]] = None
+_CLIENT_SECRET_LIFETIME = 10 * 60 # Recommended max expiration is 6 months, but shorter is safer for this use
+_CLIENT_SECRET_REFRESH_SKEW = 60
+
+
 def _generate_apple_client_secret() -> str:
     """
     Generates the client secret JWT used to authenticate with Apple's services.
     Requires APPLE_TEAM_ID, APPLE_BUNDLE_ID, APPLE_KEY_ID, APPLE_PRIVATE_KEY in config.
+    Returns the cached secret while it has more than a minute of validity left.
     """
+    global _cached_client_secret
     if not config.apple_signin_configured:
         raise RuntimeError("Apple Sign In credentials not fully configured for client secret generation.")
 
-    now = datetime.datetime.now(datetime.timezone.utc)
-    expire = now + datetime.timedelta(minutes=10) # Recommended max expiration is 6 months, but shorter is safer for this use
+    now = int(time.time())
+    if _cached_client_secret and _cached_client_secret[1] - now > _CLIENT_SECRET_REFRESH_SKEW:
+        logger.debug("Using cached Apple client secret JWT.")
+        return _cached_client_secret[0]
+
+    expire = now + _CLIENT_SECRET_LIFETIME
 
     headers = {
         "kid": config.APPLE_KEY_ID,
@@ -158,26 +349,17 @@ def _generate_apple_client_secret() -> str:
     }
 
     try:
-        # Ensure private key is in the correct PEM format (with newlines)
-        # --- Debugging Start --- 
-        raw_key_from_config = config.APPLE_PRIVATE_KEY
-        if not raw_key_from_config or not isinstance(raw_key_from_config, str):
-            logger.error("APPLE_PRIVATE_KEY is missing or not a string in config!")
+        if _apple_private_key is None:
             raise RuntimeError("APPLE_PRIVATE_KEY configuration error.")
-            
-        logger.debug(f"Raw APPLE_PRIVATE_KEY from config (repr): {repr(raw_key_from_config)}")
-        # Reinstate the replace call
-        private_key_pem = raw_key_from_config.replace("\\n", "\n") 
-        logger.debug(f"Processed private_key_pem for jwt.encode (repr): {repr(private_key_pem)}")
-        # --- Debugging End ---
 
         client_secret = jwt.encode(
             payload,
-            private_key_pem, # Using processed key
+            _apple_private_key, # Loaded once at import
             algorithm="ES256",
             headers=headers
         )
         logger.debug("Generated Apple client secret JWT.")
+        _cached_client_secret = (client_secret, expire)
         return client_secret
     except Exception as e:
         logger.error(f"Failed to generate Apple client secret: {e}", exc_info=True)
@@ -224,25 +406,25 @@ async def exchange_apple_code_for_tokens(code: str, grant_type: str = "authoriza
         raise ValueError(f"Invalid grant_type: {grant_type}")
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, headers=headers, data=data)
-            # Apple returns errors with 200 OK sometimes, check body
-            response_data = response.json()
-            if response.status_code >= 400 or 'error' in response_data:
-                error = response_data.get('error', 'unknown_error')
-                error_desc = response_data.get('error_description', 'No description provided.')
-                logger.error(f"Apple token exchange failed (Status: {response.status_code}, Error: {error}): {error_desc}")
-                # Map common errors to specific HTTP statuses if needed
-                if error == "invalid_grant": # e.g., expired code, bad refresh token
-                    raise HTTPException(status_code=401, detail=f"Invalid Apple grant: {error_desc}")
-                elif error == "invalid_client": # e.g., bad client secret
-                     raise HTTPException(status_code=401, detail="Invalid Apple client configuration.")
-                else:
-                    raise HTTPException(status_code=400, detail=f"Apple token exchange error: {error}")
-
-            logger.info(f"Successfully exchanged Apple {grant_type}."
-                        f" Received keys: {list(response_data.keys())}")
-            return response_data
+        response = await _get_client().post(token_url, headers=headers, data=data)
+        # Apple returns errors with 200 OK sometimes, check body
+        response_data = orjson.loads(response.content)
+        if response.status_code >= 400 or 'error' in response_data:
+            error = response_data.get('error', 'unknown_error')
+            error_desc = response_data.get('error_description', 'No description provided.')
+            logger.error(f"Apple token exchange failed (Status: {response.status_code}, Error: {error}): {error_desc}")
+            # Map common errors to specific HTTP statuses if needed
+            if error == "invalid_grant": # e.g., expired code, bad refresh token
+                raise HTTPException(status_code=401, detail=f"Invalid Apple grant: {error_desc}")
+            elif error == "invalid_client": # e.g., bad client secret
+                 raise HTTPException(status_code=401, detail="Invalid Apple client configuration.")
+            else:
+                raise HTTPException(status_code=400, detail=f"Apple token exchange error: {error}")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Successfully exchanged Apple %s. Received keys: %s",
+                         grant_type, list(response_data.keys()))
+        return response_data
 
     except HTTPException as http_exc:
         raise http_exc # Re-raise specific exceptions
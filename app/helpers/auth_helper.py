@@ -1,60 +1,118 @@
-import os
-from datetime import datetime, timedelta, timezone
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
 from typing import Optional, Annotated
 import uuid # Import uuid
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer  # Handles extracting token from header
 
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pydantic import BaseModel, ValidationError # Import BaseModel
-from dotenv import load_dotenv
+import bcrypt
+from cachetools import TTLCache
+import jwt
 
-from app import models
+from app import config, models
 from app.database import get_db_session
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from . import user_helper # <-- Import user_helper
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
+# Read once by app.config (which also loads .env); ALGORITHM defaults to HS256 there.
 # !! CHANGE THIS IN PRODUCTION AND KEEP IT SECRET !!
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))  # Default 30 mins
+JWT_SECRET_KEY = config.JWT_SECRET_KEY
+ALGORITHM = config.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES  # Default 30 mins
 
 # --- Password Hashing ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt is called directly; the hashes are the same $2b$ strings passlib
+# produced, so existing users keep signing in.
+BCRYPT_ROUNDS = config.BCRYPT_ROUNDS
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool:
     """Verifies a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    if not hashed_password:
+        # Apple-only accounts have no password hash.
+        return False
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except ValueError:
+        # Malformed hash in the database; treat as a failed login.
+        return False
 
 
 def get_password_hash(password: str) -> str:
     """Hashes a plain password using bcrypt."""
-    return pwd_context.hash(password)
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("ascii")
 
 
 # --- JWT Token Handling ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a JWT access token."""
     to_encode = data.copy()
+    # JWT 'exp' is integer epoch seconds, so skip the aware-datetime round trip
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = int(time.time() + expires_delta.total_seconds())
     else:
         # Default expiration time
-        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# --- Pydantic model for JWT payload ---
-class TokenPayload(BaseModel):
-    sub: uuid.UUID # Expect 'sub' claim to be a UUID
+# --- Current User Cache ---
+# Short-lived cache of users loaded by get_current_user, keyed by user_id, so authenticated
+# requests don't each pay a DB round-trip. The TTL bounds how long a deactivation can go unseen;
+# code that changes a user row should call invalidate_cached_user().
+# Entries are plain column snapshots, never ORM instances: an instance belongs to the session
+# that loaded it and is expired if that request's transaction rolls back.
+_user_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+_USER_COLUMN_KEYS = tuple(attr.key for attr in sa_inspect(models.User).column_attrs)
+
+
+def _snapshot_user(user: models.User) -> dict:
+    """Copies a freshly loaded user's column values into a dict safe to share across requests."""
+    return {key: getattr(user, key) for key in _USER_COLUMN_KEYS}
+
+
+async def _user_from_snapshot(db: AsyncSession, snapshot: dict) -> models.User:
+    """Rebuilds a fully loaded User bound to this request's session, without querying the DB."""
+    user = models.User(**snapshot)
+    # Marks the new instance as a clean, detached copy of the row so merge(load=False) accepts it
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+
+def invalidate_cached_user(user_id: uuid.UUID) -> None:
+    """Drops a user from the get_current_user cache after their row changes."""
+    _user_cache.pop(user_id, None)
+
+
+# --- Verified Token Cache ---
+# Maps raw bearer token -> (exp timestamp, user_id) for tokens that already passed signature and
+# claim checks, so repeat requests with the same token skip jwt.decode until the token expires.
+# Only successful verifications are stored. Least recently used entries are evicted past the cap.
+_verified_token_cache: "OrderedDict[str, tuple[float, uuid.UUID]]" = OrderedDict()
+_verified_token_cache_max_size: int = 10000
+
+
+def _get_cached_token_subject(token: str) -> Optional[uuid.UUID]:
+    """Returns the user_id for a previously verified, unexpired token, else None."""
+    cached = _verified_token_cache.get(token)
+    if not cached:
+        return None
+    if cached[0] <= time.time():
+        del _verified_token_cache[token]
+        return None
+    _verified_token_cache.move_to_end(token)
+    return cached[1]
+
 
 # --- OAuth2 Scheme ---
 # This tells FastAPI how to find the token (in Authorization header as Bearer token)
@@ -63,6 +121,36 @@ class TokenPayload(BaseModel):
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/signin")
 
 
+def _verify_token_subject(token: str, credentials_exception: HTTPException) -> uuid.UUID:
+    """
+    Decodes and validates the JWT, caches the verified subject until the token's exp,
+    and returns it as a UUID. Raises credentials_exception on any failure.
+    """
+    try:
+        # Decode the JWT token
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        
+        # Extract user_id string from 'sub' claim
+        user_id_str: str = payload.get("sub")
+        if user_id_str is None:
+            raise credentials_exception
+        
+        # The subject must be a UUID; uuid.UUID validates the format directly
+        user_id = uuid.UUID(user_id_str)
+
+    except (jwt.PyJWTError, ValueError, TypeError) as e: # Catch potential UUID conversion error
+        # Handle errors during decoding or UUID conversion
+        logger.debug("Token validation error: %s", e)
+        raise credentials_exception
+
+    token_exp = payload.get("exp")
+    if token_exp:
+        _verified_token_cache[token] = (float(token_exp), user_id)
+        if len(_verified_token_cache) > _verified_token_cache_max_size:
+            _verified_token_cache.popitem(last=False)
+    return user_id
+
+
 # --- Dependency to get current user ---
 async def get_current_user(
         token: Annotated[str, Depends(oauth2_scheme)],  # Extracts token from header
@@ -77,28 +165,19 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        # Decode the JWT token
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # Extract user_id string from 'sub' claim
-        user_id_str: str = payload.get("sub")
-        if user_id_str is None:
-            raise credentials_exception
-        
-        # Validate the payload using the TokenPayload schema
-        # This implicitly converts the user_id_str to UUID and validates format
-        token_data = TokenPayload(sub=user_id_str)
+    user_id = _get_cached_token_subject(token)
+    if user_id is None:
+        user_id = _verify_token_subject(token, credentials_exception)
 
-    except (JWTError, ValidationError, ValueError) as e: # Catch potential UUID conversion error
-        # Handle errors during decoding, Pydantic validation, or UUID conversion
-        print(f"Token validation error: {e}") # Add logging
-        raise credentials_exception
+    # Get the user from the cache, falling back to the database, based on the user_id in the token
+    cached_snapshot = _user_cache.get(user_id)
+    if cached_snapshot is not None:
+        return await _user_from_snapshot(db, cached_snapshot)
 
-    # Get the user from the database based on the user_id in the token
-    user = await user_helper.get_user_by_id(db, user_id=token_data.sub)
+    user = await user_helper.get_user_by_id(db, user_id=user_id)
     if user is None:
         raise credentials_exception
+    _user_cache[user_id] = _snapshot_user(user)
     # Optional: Check if user is active (done by get_current_active_user)
     return user
 
@@ -0,0 +1,29 @@
+import hashlib
+from datetime import datetime
+from typing import Optional, Tuple
+
+from cachetools import TTLCache
+
+# --- Summary Cache ---
+# Feed runs overlap, so the same article URL comes back run after run. Summaries are cached
+# under (url, SHA-256 of the extracted text) for a day: an unchanged page reuses its summary
+# and timestamp instead of going back to Gemini, while an edited page hashes differently and
+# is summarized again. get/set never await, so no lock is needed on the event loop.
+_summary_cache: TTLCache = TTLCache(maxsize=10000, ttl=86400)
+
+
+def _cache_key(url: str, text_content: str) -> Tuple[str, bytes]:
+    return url, hashlib.sha256(text_content.encode("utf-8")).digest()
+
+
+def get_cached_summary(url: Optional[str], text_content: str) -> Optional[Tuple[str, datetime]]:
+    """Returns (summary, summary_generated_at) for an unchanged article, else None."""
+    if not url:
+        return None
+    return _summary_cache.get(_cache_key(url, text_content))
+
+
+def cache_summary(url: Optional[str], text_content: str, summary: str, generated_at: datetime) -> None:
+    """Remembers a generated summary for this URL and extracted text."""
+    if url:
+        _summary_cache[_cache_key(url, text_content)] = (summary, generated_at)
@@ -1,37 +1,35 @@
 # --- Standard Library Imports ---
+import asyncio
 import logging
 import os
-import json
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Dict, Any, Optional, List, Set
+from typing import Annotated, Awaitable, Callable, Dict, Any, Optional, List, Set, Tuple
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from contextlib import asynccontextmanager
 
 # --- Third-party Imports ---
 import httpx
-from bs4 import BeautifulSoup
+import orjson
 import google.generativeai as genai
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy import select, exists, desc  # Added desc import
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # --- Application Imports (Adjust paths as necessary) ---
 from app import config  # Your application config
-from app.database import get_db_session  # Your DB session dependency
+from app.database import get_db_session, get_session_factory  # Your DB session dependency
 from app.helpers.gnews_helper import analyze_gnews_data
-from app.helpers.summary_utils import fetch_page_content, extract_text_from_html, generate_summary_from_text
+from app.helpers import summary_cache
+from app.helpers.summary_utils import fetch_page_content, extract_text_from_html, get_http_client, summarize_articles
 from app.models.models import ArticleRecord, GNewsArticleSummary  # Your SQLAlchemy model
 from app.models.summary import ArticleForProcessing, GNewsSummaryData  # Your Pydantic schema for validation/response
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
-if not logger.hasHandlers():
-    # Configure basic logging if no handlers are configured elsewhere
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # --- Global Variables & Configuration ---
 DbSession = Annotated[AsyncSession, Depends(get_db_session)]
@@ -49,6 +47,10 @@ else:
 
 MODEL_NAME = config.GEMINI_MODEL_NAME
 
+# Built once; each validates a whole batch of articles (latest news, GNews) in a single call
+_ARTICLES_ADAPTER = TypeAdapter(List[ArticleForProcessing])
+_GNEWS_ARTICLES_ADAPTER = TypeAdapter(List[GNewsSummaryData])
+
 
 # === Core Helper Functions ===
 
@@ -61,14 +63,14 @@ async def fetch_latest_news_data():
     (Removed hours parameter)
     """
     # 1. Get the current time in UTC
-    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    now_utc = datetime.now(timezone.utc)
 
     # 2. Calculate the time 12 hours ago
     twelve_hours_ago_utc = now_utc - timedelta(hours=12)
 
-    # 3. Format the time in YYYY-MM-DDTHH:MM:SSZ format
-    #    strftime formats the date and time, then we append 'Z' for UTC.
+    # 3. Format both bounds as YYYY-MM-DDTHH:MM:SSZ
     from_time_str = twelve_hours_ago_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    to_time_str = now_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
 
     # 4. Construct the API parameters dictionary
     api_params = {
@@ -76,38 +78,98 @@ async def fetch_latest_news_data():
         "country": config.NEWS_COUNTRY,
         "prioritydomain": config.PRIORITY_DOMAIN,
         "from": from_time_str,  # Add the dynamically calculated 'from' time
-        "to": now_utc
+        "to": to_time_str
     }
     url = config.NEWS_API_URL  # Ensure this is set in your config
 
-    async with httpx.AsyncClient() as client:
-        try:
-            logger.info(f"Requesting latest news data from API: {url} with params: {api_params}")
-            response = await client.get(url, params=api_params)
-            response.raise_for_status()
-            news_data = response.json()
-            logger.info(f"Successfully fetched latest news list. Total results: {news_data.get('totalResults')}")
-            return news_data
-        # ... (rest of error handling as before) ...
-        except httpx.HTTPStatusError as exc:
-            logger.error(
-                f"HTTP error fetching latest news list: {exc.response.status_code} for URL {exc.request.url!r}")
-            raise HTTPException(status_code=exc.response.status_code, detail="Error fetching news list from source.")
-        except httpx.RequestError as exc:
-            logger.error(f"Request error fetching latest news list: {exc}")
-            raise HTTPException(status_code=503, detail="Network error fetching news list from source.")
-        except json.JSONDecodeError as exc:
-            logger.error(f"Error decoding JSON from news list API: {exc}")
-            raise HTTPException(status_code=500, detail="Invalid JSON response from news list source.")
-        except Exception as exc:
-            logger.error(f"Unexpected error fetching latest news list: {exc}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Unexpected error fetching latest news list.")
-
-
-async def analyze_news_data() -> List[Dict[str, Any]]:
+    client = get_http_client()
+    try:
+        logger.info(f"Requesting latest news data from API: {url} with params: {api_params}")
+        response = await client.get(url, params=api_params)
+        response.raise_for_status()
+        news_data = orjson.loads(response.content)
+        logger.info(f"Successfully fetched latest news list. Total results: {news_data.get('totalResults')}")
+        return news_data
+    # ... (rest of error handling as before) ...
+    except httpx.HTTPStatusError as exc:
+        logger.error(
+            f"HTTP error fetching latest news list: {exc.response.status_code} for URL {exc.request.url!r}")
+        raise HTTPException(status_code=exc.response.status_code, detail="Error fetching news list from source.")
+    except httpx.RequestError as exc:
+        logger.error(f"Request error fetching latest news list: {exc}")
+        raise HTTPException(status_code=503, detail="Network error fetching news list from source.")
+    except orjson.JSONDecodeError as exc:
+        logger.error(f"Error decoding JSON from news list API: {exc}")
+        raise HTTPException(status_code=500, detail="Invalid JSON response from news list source.")
+    except Exception as exc:
+        logger.error(f"Unexpected error fetching latest news list: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Unexpected error fetching latest news list.")
+
+
+async def _process_news_article(article: Dict[str, Any], semaphore: asyncio.Semaphore) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Fetches and extracts one article from the latest news feed.
+    Returns the structured article data (summary not yet filled in) with the text to summarize,
+    or None if the article must be skipped.
+    """
+    article_id = article.get("article_id")
+    if not article_id:
+        logger.warning("Found article with no article_id. Skipping.")
+        return None
+
+    title = article.get("title")
+    link = article.get("link")
+    description = article.get("description")
+    keywords = article.get("keywords")
+    pubDate_str = article.get("pubDate")
+
+    logger.debug("Processing article ID: %s, Title: %s", article_id, title)
+
+    if not link:
+        logger.warning("Article ID %s ('%s') has no link. Skipping.", article_id, title)
+        return None
+
+    async with semaphore:
+        # 3. Fetch and Parse (summaries are generated in batches afterwards)
+        html_content = await fetch_page_content(link)
+        article_text_to_summarize = None
+        if html_content:
+            # Parsing is CPU-bound; run it on a worker thread so other fetches keep progressing
+            article_text_to_summarize = await asyncio.to_thread(extract_text_from_html, html_content)
+            if not article_text_to_summarize:
+                logger.warning(
+                    "Could not extract text from %s for article ID %s. Falling back to description.",
+                    link, article_id)
+                if description: article_text_to_summarize = description
+        else:
+            logger.warning(
+                "Failed to fetch content from %s for article ID %s. Falling back to description.",
+                link, article_id)
+            if description: article_text_to_summarize = description
+
+    if not article_text_to_summarize:
+        logger.warning("No content (fetched or description) available to summarize for article ID %s.", article_id)
+
+    # 4. Structure the result
+    processed_article_data = {
+        "article_id": article_id,
+        "title": title,
+        "reference_url": link,
+        "description": description,
+        "keywords": keywords,
+        "summary": None,
+        "source_name": article.get("source_name"),
+        "pubDate": pubDate_str,  # Keep as string for Pydantic/DB layer to handle
+        "summary_generated_at": None
+    }
+    return processed_article_data, article_text_to_summarize
+
+
+async def analyze_news_data(db: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
     """
     Fetches the LATEST news list, then for each article: fetches its content,
     generates a summary using Gemini, and combines with original metadata.
+    When a session is given, articles whose article_id is already stored are skipped.
     """
     processed_articles: List[Dict[str, Any]] = []
     fetch_timestamp = datetime.now(timezone.utc)
@@ -120,102 +182,87 @@ async def analyze_news_data() -> List[Dict[str, Any]]:
             return []
     # ... (rest of error handling as before) ...
     except HTTPException as http_exc:
-        logger.error(f"Failed to fetch initial latest news list: {http_exc.detail} (Status: {http_exc.status_code})")
+        logger.error("Failed to fetch initial latest news list: %s (Status: %s)", http_exc.detail, http_exc.status_code)
         return []
     except Exception as e:
-        logger.error(f"Unexpected error during initial latest news list fetch: {e}", exc_info=True)
+        logger.error("Unexpected error during initial latest news list fetch: %s", e, exc_info=True)
         return []
 
     articles_to_process = news_data.get('results', [])
-    logger.info(f"Starting analysis for {len(articles_to_process)} articles fetched from the latest news feed.")
-
-    # 2. Process each article
-    for article in articles_to_process:
-        article_id = article.get("article_id")
-        if not article_id:
-            logger.warning("Found article with no article_id. Skipping.")
-            continue
-
-        title = article.get("title")
-        link = article.get("link")
-        description = article.get("description")
-        keywords = article.get("keywords")
-        pubDate_str = article.get("pubDate")
-
-        logger.debug(f"Processing article ID: {article_id}, Title: {title}")
-
-        if not link:
-            logger.warning(f"Article ID {article_id} ('{title}') has no link. Skipping.")
-            continue
-
-        generated_summary = None
-        summary_generated_at_ts = None
 
-        # 3. Fetch, Parse, Summarize...
-        html_content = await fetch_page_content(link)
-        article_text_to_summarize = None
-        if html_content:
-            article_text_to_summarize = extract_text_from_html(html_content)
-            if not article_text_to_summarize:
-                logger.warning(
-                    f"Could not extract text from {link} for article ID {article_id}. Falling back to description.")
-                if description: article_text_to_summarize = description
+    # Skip articles that are already stored before paying for their fetch and Gemini call
+    if db is not None:
+        candidate_ids = [a['article_id'] for a in articles_to_process if a.get('article_id')]
+        if candidate_ids:
+            try:
+                existing_results = await db.execute(
+                    select(ArticleRecord.article_id).where(ArticleRecord.article_id.in_(candidate_ids)))
+                existing_article_ids = set(existing_results.scalars().all())
+                # End the read transaction now; otherwise the pooled connection sits idle in
+                # transaction through the fetch/Gemini fan-out below, which can take minutes.
+                await db.commit()
+            except Exception as e:
+                logger.error("Could not check for already stored articles: %s. Processing all of them.", e)
+                await db.rollback()
+                existing_article_ids = set()
+            if existing_article_ids:
+                articles_to_process = [
+                    a for a in articles_to_process if a.get('article_id') not in existing_article_ids]
+                logger.info("Skipping %s articles that are already stored.", len(existing_article_ids))
+
+    logger.info("Starting analysis for %s articles fetched from the latest news feed.", len(articles_to_process))
+
+    # 2. Fetch and extract the articles concurrently; the semaphore bounds in-flight fetches and Gemini calls
+    semaphore = asyncio.Semaphore(config.SUMMARY_MAX_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_process_news_article(article, semaphore) for article in articles_to_process),
+        return_exceptions=True,
+    )
+    to_summarize: List[Tuple[Dict[str, Any], str]] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Unexpected error processing a latest news article: %r", result, exc_info=result)
+        elif result is not None:
+            processed_article_data, article_text_to_summarize = result
+            processed_articles.append(processed_article_data)
+            if article_text_to_summarize:
+                to_summarize.append((processed_article_data, article_text_to_summarize))
+
+    # 3. Summarize in batches, several articles per Gemini call
+    # Unchanged articles (same URL and extracted text) reuse the summary from an earlier run
+    pending: List[Tuple[Dict[str, Any], str]] = []
+    for processed_article_data, article_text_to_summarize in to_summarize:
+        cached = summary_cache.get_cached_summary(processed_article_data["reference_url"], article_text_to_summarize)
+        if cached:
+            processed_article_data["summary"], processed_article_data["summary_generated_at"] = cached
         else:
-            logger.warning(
-                f"Failed to fetch content from {link} for article ID {article_id}. Falling back to description.")
-            if description: article_text_to_summarize = description
-
-        if article_text_to_summarize:
-            generated_summary = await generate_summary_from_text(article_text_to_summarize, title)
-            if generated_summary:
-                summary_generated_at_ts = datetime.now(timezone.utc)
-            else:
-                logger.warning(
-                    f"Failed to generate summary for article ID {article_id} (used {'description' if not html_content or not article_text_to_summarize else 'fetched content'}).")
+            pending.append((processed_article_data, article_text_to_summarize))
+
+    summaries = await summarize_articles(
+        [(text, data["title"], None) for data, text in pending], semaphore
+    )
+    summary_generated_at_ts = datetime.now(timezone.utc)
+    for (processed_article_data, article_text_to_summarize), generated_summary in zip(pending, summaries):
+        if generated_summary:
+            processed_article_data["summary"] = generated_summary
+            processed_article_data["summary_generated_at"] = summary_generated_at_ts
+            summary_cache.cache_summary(processed_article_data["reference_url"], article_text_to_summarize,
+                                        generated_summary, summary_generated_at_ts)
         else:
-            logger.warning(f"No content (fetched or description) available to summarize for article ID {article_id}.")
-
-        # 4. Structure the result
-        processed_article_data = {
-            "article_id": article_id,
-            "title": title,
-            "reference_url": link,
-            "description": description,
-            "keywords": keywords,
-            "summary": generated_summary,
-            "source_name": article.get("source_name"),
-            "pubDate": pubDate_str,  # Keep as string for Pydantic/DB layer to handle
-            "summary_generated_at": summary_generated_at_ts
-        }
-        processed_articles.append(processed_article_data)
+            logger.warning("Failed to generate summary for article ID %s.", processed_article_data['article_id'])
 
-    logger.info(f"Finished analysis. Processed {len(processed_articles)} articles from the latest news feed.")
+    logger.info("Finished analysis. Processed %s articles from the latest news feed.", len(processed_articles))
     return processed_articles
 
 
-async def save_processed_articles(db: AsyncSession, processed_articles: List[Dict[str, Any]]):
+def _build_article_rows(processed_articles: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
     """
-    Saves a list of processed article data dictionaries to the database.
-    Checks for existing articles based on article_id to avoid duplicates,
-    and handles potential IntegrityErrors during commit due to race conditions.
+    Dedups and validates processed articles into ArticleRecord column values.
+    Synchronous so it can run in a worker thread. Returns (rows, skipped_count).
     """
-    articles_added_count = 0
     articles_skipped_count = 0
-    articles_to_add = []  # Keep track of records added to the session
-    logger.info(f"Attempting to save {len(processed_articles)} processed articles to database.")
-
-    existing_article_ids = set()
-    # Optional optimization: Fetch all potentially existing IDs in one query
-    # This reduces DB load compared to checking one by one inside the loop,
-    # but might fetch more than needed if processed_articles is small.
-    # Comment this section out if you prefer the per-article check inside the loop.
-    potential_ids = [a.get("article_id") for a in processed_articles if a.get("article_id")]
-    if potential_ids:
-        id_check_stmt = select(ArticleRecord.article_id).where(ArticleRecord.article_id.in_(potential_ids))
-        existing_results = await db.execute(id_check_stmt)
-        existing_article_ids = set(existing_results.scalars().all())
-        logger.debug(f"Pre-checked existence for {len(potential_ids)} IDs, found {len(existing_article_ids)} existing.")
-
+    candidates: List[Dict[str, Any]] = []
+    seen_article_ids: Set[str] = set()  # Duplicates within this batch; stored rows are skipped by ON CONFLICT
     for article_data in processed_articles:
         article_id = article_data.get("article_id")
         if not article_id:
@@ -223,109 +270,153 @@ async def save_processed_articles(db: AsyncSession, processed_articles: List[Dic
             articles_skipped_count += 1
             continue
 
-        try:
-            # --- Check against pre-fetched set (or query DB if not pre-fetching) ---
-            # article_exists = article_id in existing_article_ids # Use this if pre-fetching
-            # --- OR ---
-            # Check if article already exists (if not pre-fetching)
-            stmt = select(exists().where(ArticleRecord.article_id == article_id))
-            article_exists = await db.scalar(stmt)
-            # --- End Check Choice ---
-
-            if article_exists:
-                if article_id not in existing_article_ids:  # Log only if not already known from pre-fetch
-                    logger.debug(f"Article ID {article_id} already exists in DB. Skipping.")
-                articles_skipped_count += 1
-                continue
-            # --- END CHECK ---
+        if article_id in seen_article_ids:
+            logger.debug("Article ID %s appears more than once in this batch. Skipping.", article_id)
+            articles_skipped_count += 1
+            continue
 
-            # --- If article does not exist, proceed with validation and creation ---
+        seen_article_ids.add(article_id)
+        candidates.append(article_data)
+
+    # Validate the whole batch in one call; only if it fails, go row by row to skip the offenders
+    try:
+        validated_articles = _ARTICLES_ADAPTER.validate_python(candidates)
+    except ValidationError:
+        validated_articles = []
+        for article_data in candidates:
             try:
-                pydantic_article = ArticleForProcessing(
-                    article_id=article_id,
-                    title=article_data.get('title'),
-                    reference_url=article_data.get('reference_url'),
-                    description=article_data.get('description'),
-                    keywords=article_data.get('keywords'),
-                    summary=article_data.get('summary'),
-                    source_name=article_data.get('source_name'),
-                    pubDate=article_data.get('pubDate'),
-                    summary_generated_at=article_data.get('summary_generated_at')
-                )
-                new_record = ArticleRecord(
-                    article_id=pydantic_article.article_id,
-                    title=pydantic_article.title,
-                    reference_url=str(pydantic_article.reference_url) if pydantic_article.reference_url else None,
-                    description=pydantic_article.description,
-                    keywords=pydantic_article.keywords,
-                    summary=pydantic_article.summary,
-                    source_name=pydantic_article.source_name,
-                    publication_date=pydantic_article.publication_date,
-                    summary_generated_at=pydantic_article.summary_generated_at
-                )
+                validated_articles.append(ArticleForProcessing.model_validate(article_data))
             except ValidationError as val_err:
-                logger.error(f"Pydantic validation failed for article ID {article_id}: {val_err}. Skipping save.")
-                articles_skipped_count += 1
-                continue
-            except Exception as map_err:
-                logger.error(f"Error mapping data for article ID {article_id}: {map_err}. Skipping save.",
-                             exc_info=True)
+                logger.error(
+                    "Pydantic validation failed for article ID %s: %s. Skipping save.",
+                    article_data['article_id'], val_err)
                 articles_skipped_count += 1
-                continue
 
-            # Add the new record to the list to be added to session
-            articles_to_add.append(new_record)
-            articles_added_count += 1
-            logger.debug(f"Prepared article ID {article_id} for insertion.")
+    rows_to_insert: List[Dict[str, Any]] = [
+        {
+            "article_id": pydantic_article.article_id,
+            "title": pydantic_article.title,
+            "reference_url": str(pydantic_article.reference_url) if pydantic_article.reference_url else None,
+            "description": pydantic_article.description,
+            "keywords": pydantic_article.keywords,
+            "summary": pydantic_article.summary,
+            "source_name": pydantic_article.source_name,
+            "publication_date": pydantic_article.publication_date,
+            "summary_generated_at": pydantic_article.summary_generated_at,
+        }
+        for pydantic_article in validated_articles
+    ]
+
+    return rows_to_insert, articles_skipped_count
+
+
+async def save_processed_articles(db: AsyncSession, processed_articles: List[Dict[str, Any]]):
+    """
+    Saves a list of processed article data dictionaries to the database.
+    Rows are written with a single executemany INSERT ... ON CONFLICT DO NOTHING,
+    so article_ids already stored (or inserted concurrently by another run) are
+    skipped by the database instead of being looked up first.
+    """
+    logger.info("Attempting to save %s processed articles to database.", len(processed_articles))
+
+    # Validation and row building are CPU-bound; keep them off the event loop
+    rows_to_insert, articles_skipped_count = await asyncio.to_thread(_build_article_rows, processed_articles)
+
+    if not rows_to_insert:
+        logger.info(
+            "No new articles were added to the session in this batch. Total Skipped: %s.",
+            articles_skipped_count)
+        return
+
+    # RETURNING reports which rows were actually inserted (conflicting ones are skipped silently)
+    insert_stmt = (
+        pg_insert(ArticleRecord)
+        .on_conflict_do_nothing(index_elements=[ArticleRecord.article_id])
+        .returning(ArticleRecord.article_id)
+    )
+    try:
+        result = await db.execute(insert_stmt, rows_to_insert)
+        articles_added_count = len(result.scalars().all())
+        await db.commit()
+        articles_skipped_count += len(rows_to_insert) - articles_added_count
+        logger.info(
+            "Successfully committed %s new articles to the database. Skipped %s.",
+            articles_added_count, articles_skipped_count)
+    except Exception as commit_err:
+        logger.error("Database insert/commit failed unexpectedly: %s", commit_err, exc_info=True)
+        await db.rollback()
+        logger.info("Database transaction rolled back due to unexpected commit error.")
+
+
+def _build_gnews_rows(processed_articles: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Dedups and validates processed GNews articles into GNewsArticleSummary column values.
+    Synchronous so it can run in a worker thread. Returns (rows, skipped_count).
+    """
+    articles_skipped_count = 0
+    candidates: List[Dict[str, Any]] = []
+    seen_urls: Set[str] = set()  # Duplicates within this batch; stored URLs are skipped by ON CONFLICT
 
-        except Exception as e:
-            logger.error(f"Error processing article ID {article_id} for saving: {e}", exc_info=True)
+    # --- Identify each article by URL ---
+    for article_data in processed_articles:
+        url_str = article_data.get("url")  # Get the URL, likely as a string initially
+        if not isinstance(url_str, str) or not url_str:
+            # Log title if available for better identification of skipped item
+            title_preview = (article_data.get('title') or 'N/A')[:50]
+            logger.warning(
+                "Skipping article data with missing or invalid URL (Title: '%s...'). URL value: %s",
+                title_preview, url_str)
             articles_skipped_count += 1
             continue
 
-    # Add all prepared records to the session
-    if articles_to_add:
-        db.add_all(articles_to_add)
-        logger.info(f"Added {len(articles_to_add)} new article records to the session.")
-    else:
-        logger.info("No new articles qualified for adding to the session.")
+        # --- Skip URLs repeated within this batch ---
+        if url_str in seen_urls:
+            articles_skipped_count += 1
+            continue
 
-    # Commit changes if any articles were added to the session
-    if articles_added_count > 0 and articles_to_add:  # Check both to be safe
-        try:
-            await db.commit()
-            logger.info(
-                f"Successfully committed {articles_added_count} new articles to the database. Skipped {articles_skipped_count}.")
-        # --- ADDED HANDLING FOR COMMIT-TIME IntegrityError ---
-        except IntegrityError as commit_err:
-            # Check if it's the specific unique violation error we expect
-            # The specific error code for unique_violation in PostgreSQL is '23505'
-            if isinstance(commit_err.orig, Exception) and getattr(commit_err.orig, 'sqlstate', None) == '23505':
+        seen_urls.add(url_str)
+        candidates.append(article_data)
+
+    # --- Validate the whole batch in one call; only if it fails, go row by row to skip the offenders ---
+    try:
+        validated_articles = _GNEWS_ARTICLES_ADAPTER.validate_python(candidates)
+    except ValidationError:
+        validated_articles = []
+        for article_data in candidates:
+            try:
+                validated_articles.append(GNewsSummaryData.model_validate(article_data))
+            except ValidationError as val_err:
+                title_preview = (article_data.get('title') or 'N/A')[:50]
                 logger.warning(
-                    f"Database commit failed likely due to race condition (unique constraint violation): {commit_err.orig}. Rolling back.")
-            else:
-                # Log other IntegrityErrors more severely
-                logger.error(f"Database commit failed due to IntegrityError: {commit_err}", exc_info=True)
-            await db.rollback()
-            logger.info("Database transaction rolled back due to commit error.")
-        # --- END HANDLING ---
-        except Exception as commit_err:
-            # Catch other potential commit errors
-            logger.error(f"Database commit failed unexpectedly: {commit_err}", exc_info=True)
-            await db.rollback()
-            logger.info("Database transaction rolled back due to unexpected commit error.")
-    else:
-        # No need to commit if nothing was added
-        logger.info(
-            f"No new articles were added to the session in this batch. Total Skipped: {articles_skipped_count}.")
+                    "Pydantic validation failed for article (URL: %s, Title: '%s'): %s. Skipping save.",
+                    article_data['url'], title_preview, val_err)
+                articles_skipped_count += 1
+
+    # --- Map the validated objects to column values for the bulk INSERT ---
+    rows_to_insert: List[Dict[str, Any]] = [
+        {
+            "title": pydantic_article.title,
+            "description": pydantic_article.description,
+            "url": str(pydantic_article.url),
+            "image_url": str(pydantic_article.image_url) if pydantic_article.image_url else None,
+            "published_at": pydantic_article.published_at,  # Pydantic ensures this is datetime
+            "source_name": pydantic_article.source_name,
+            "source_url": str(pydantic_article.source_url) if pydantic_article.source_url else None,
+            "summary": pydantic_article.summary,
+            "summary_generated_at": pydantic_article.summary_generated_at,
+        }
+        for pydantic_article in validated_articles
+    ]
+
+    return rows_to_insert, articles_skipped_count
 
 
 async def save_processed_gnews_articles(db: AsyncSession, processed_articles: List[Dict[str, Any]]):
     """
     Saves a list of processed article data dictionaries to the database
-    using the GNewsArticleSummary model. Checks for existing articles
-    based on the unique 'url' field to avoid duplicates, and handles potential
-    IntegrityErrors during commit due to race conditions or other constraints.
+    using the GNewsArticleSummary model. Rows are inserted in one executemany
+    with ON CONFLICT (url) DO NOTHING, so URLs that are already stored are skipped
+    by the database.
 
     Args:
         db: The AsyncSession instance.
@@ -336,142 +427,39 @@ async def save_processed_gnews_articles(db: AsyncSession, processed_articles: Li
         A tuple containing (articles_added_count, articles_skipped_count).
     """
     articles_added_count = 0
-    articles_skipped_count = 0
-    articles_to_add: List[GNewsArticleSummary] = []  # List of SQLAlchemy objects
     logger.info(
-        f"Attempting to save {len(processed_articles)} processed articles to table '{GNewsArticleSummary.__tablename__}'.")
-
-    existing_urls: Set[str] = set()
-    # --- Pre-fetch existing URLs (Optimization) ---
-    # Extract potential URLs ensuring they are strings before querying
-    potential_urls = []
-    for a in processed_articles:
-        url_val = a.get("url")
-        if isinstance(url_val, str) and url_val:
-            potential_urls.append(url_val)
-        elif url_val:
-            # Log if URL is not a string, might indicate an issue upstream
-            logger.warning(f"Article data contains non-string URL: {url_val}. Skipping pre-fetch check for this item.")
-
-    if potential_urls:
-        try:
-            # Query using the correct SQLAlchemy model and field
-            url_check_stmt = select(GNewsArticleSummary.url).where(GNewsArticleSummary.url.in_(potential_urls))
-            existing_results = await db.execute(url_check_stmt)
-            existing_urls = set(existing_results.scalars().all())
-            if existing_urls:
-                logger.debug(
-                    f"Pre-checked existence for {len(potential_urls)} URLs, found {len(existing_urls)} existing.")
-            else:
-                logger.debug(f"Pre-checked existence for {len(potential_urls)} URLs, none found existing.")
-        except Exception as fetch_err:
-            logger.error(f"Error pre-fetching existing article URLs: {fetch_err}. Proceeding without pre-fetch.",
-                         exc_info=True)
-            existing_urls = set()  # Reset on error
-
-    # --- Process each article dictionary ---
-    for article_data in processed_articles:
-        # --- Identify the article using URL ---
-        url_str = article_data.get("url")  # Get the URL, likely as a string initially
-        if not isinstance(url_str, str) or not url_str:
-            # Log title if available for better identification of skipped item
-            title_preview = article_data.get('title', 'N/A')[:50]
-            logger.warning(
-                f"Skipping article data with missing or invalid URL (Title: '{title_preview}...'). URL value: {url_str}")
-            articles_skipped_count += 1
-            continue
+        "Attempting to save %s processed articles to table '%s'.",
+        len(processed_articles), GNewsArticleSummary.__tablename__)
 
-        try:
-            # --- Check for Duplicates using URL ---
-            if url_str in existing_urls:
-                # Already known to exist from pre-fetch
-                articles_skipped_count += 1
-                continue
-            # --- Fallback DB Check (Optional - if not pre-fetching or as double check) ---
-            # Uncomment if needed
-            # stmt = select(exists().where(GNewsArticleSummary.url == url_str))
-            # article_exists_in_db = await db.scalar(stmt)
-            # if article_exists_in_db:
-            #     logger.debug(f"Article URL {url_str} already exists in DB (checked individually). Skipping.")
-            #     articles_skipped_count += 1
-            #     continue
-            # --- End Fallback Check ---
-
-            # --- If article URL does not exist, proceed with validation and creation ---
-            try:
-                # 1. Validate data using Pydantic model
-                # Ensure GNewsSummaryData includes summary & summary_generated_at fields
-                pydantic_article = GNewsSummaryData(**article_data)
-
-                # 2. Create SQLAlchemy model instance from validated Pydantic object
-                new_record = GNewsArticleSummary(
-                    # --- Existing Mappings ---
-                    title=pydantic_article.title,
-                    description=pydantic_article.description,
-                    url=str(pydantic_article.url),
-                    image_url=str(pydantic_article.image_url) if pydantic_article.image_url else None,
-                    published_at=pydantic_article.published_at,  # Pydantic ensures this is datetime
-                    source_name=pydantic_article.source_name,
-                    source_url=str(pydantic_article.source_url) if pydantic_article.source_url else None,
-                    # --- Add Missing Mappings ---
-                    summary=pydantic_article.summary,  # Add this line
-                    summary_generated_at=pydantic_article.summary_generated_at  # Add this line
-                    # --- End Add ---
-                )
-            except ValidationError as val_err:
-                title_preview = article_data.get('title', 'N/A')[:50]
-                logger.warning(
-                    f"Pydantic validation failed for article (URL: {url_str}, Title: '{title_preview}'): {val_err}. Skipping save.")
-                articles_skipped_count += 1
-                continue
-            except Exception as map_err:
-                # Catch broader errors during Pydantic/SQLAlchemy instantiation
-                title_preview = article_data.get('title', 'N/A')[:50]
-                logger.error(
-                    f"Error creating models for article (URL: {url_str}, Title: '{title_preview}'): {map_err}. Skipping save.",
-                    exc_info=True)
-                articles_skipped_count += 1
-                continue
-
-            # Add the new record to the list to be added to session
-            articles_to_add.append(new_record)
-            logger.debug(f"Prepared article (URL: {url_str}, Title: '{pydantic_article.title[:50]}...') for insertion.")
-
-        except Exception as e:
-            # Catch unexpected errors during the processing of a single article dict
-            title_preview = article_data.get('title', 'N/A')[:50]
-            logger.error(
-                f"Unexpected error processing article data (URL: {url_str}, Title: '{title_preview}...') for saving: {e}",
-                exc_info=True)
-            articles_skipped_count += 1
-            continue
+    # Validation and row building are CPU-bound; keep them off the event loop
+    rows_to_insert, articles_skipped_count = await asyncio.to_thread(_build_gnews_rows, processed_articles)
 
-    # --- Add all prepared records to the session and commit ---
-    if articles_to_add:
+    # --- Insert all prepared rows in one executemany and commit ---
+    if rows_to_insert:
         logger.info(
-            f"Adding {len(articles_to_add)} new articles to the session for table '{GNewsArticleSummary.__tablename__}'.")
-        db.add_all(articles_to_add)
+            "Inserting %s new articles into table '%s'.",
+            len(rows_to_insert), GNewsArticleSummary.__tablename__)
+        # ON CONFLICT skips URLs inserted concurrently; RETURNING reports which rows actually went in
+        insert_stmt = (
+            pg_insert(GNewsArticleSummary)
+            .on_conflict_do_nothing(index_elements=[GNewsArticleSummary.url])
+            .returning(GNewsArticleSummary.url)
+        )
         try:
+            result = await db.execute(insert_stmt, rows_to_insert)
+            articles_added_count = len(result.scalars().all())
             await db.commit()
-            articles_added_count = len(articles_to_add)  # Count successfully committed articles
-            logger.info(f"Successfully committed {articles_added_count} new articles.")
-        except IntegrityError as int_err:
-            await db.rollback()
-            # IntegrityError likely due to unique constraint violation (URL) from race condition
-            logger.error(
-                f"Database integrity error during commit (likely duplicate URL race condition): {int_err}. Rolled back transaction.",
-                exc_info=False)  # exc_info=False is often enough for IntegrityError
-            articles_skipped_count += len(articles_to_add)
-            articles_added_count = 0
+            articles_skipped_count += len(rows_to_insert) - articles_added_count
+            logger.info("Successfully committed %s new articles.", articles_added_count)
         except Exception as commit_err:
             await db.rollback()
-            logger.error(f"Error during database commit: {commit_err}. Rolled back transaction.", exc_info=True)
-            articles_skipped_count += len(articles_to_add)
+            logger.error("Error during database insert/commit: %s. Rolled back transaction.", commit_err, exc_info=True)
+            articles_skipped_count += len(rows_to_insert)
             articles_added_count = 0
     else:
         logger.info("No new articles were prepared for addition.")
 
-    logger.info(f"Article saving finished. Added: {articles_added_count}, Skipped: {articles_skipped_count}")
+    logger.info("Article saving finished. Added: %s, Skipped: %s", articles_added_count, articles_skipped_count)
     return articles_added_count, articles_skipped_count
 
 
@@ -482,7 +470,7 @@ async def process_and_save_hourly_news(db: AsyncSession):
     """
     logger.info("Starting hourly news processing task...")
     try:
-        processed_articles_list = await analyze_news_data()  # Call analysis function
+        processed_articles_list = await analyze_news_data(db=db)  # Call analysis function
         if processed_articles_list:
             await save_processed_articles(db=db, processed_articles=processed_articles_list)
         else:
@@ -510,36 +498,15 @@ async def process_and_save_hourly_gnews(db: AsyncSession):
         await db.rollback()  # Ensure rollback on failure
 
 
-async def gnews_hourly_job_wrapper():
-    """Wrapper to get DB session for the hourly job."""
-    logger.info("Scheduler triggered hourly job...")
-    session_gen = get_db_session()  # Assumes this yields an AsyncSession
-    session: AsyncSession = await session_gen.__anext__()
+async def scheduled_job_wrapper(job: Callable[[AsyncSession], Awaitable[None]]):
+    """Wrapper to get a DB session for a scheduled job (e.g. process_and_save_hourly_gnews)."""
+    logger.info("Scheduler triggered %s...", job.__name__)
     try:
-        await process_and_save_hourly_gnews(db=session)
+        # Sessions come straight from the session factory; the FastAPI dependency is for requests only
+        async with get_session_factory()() as session:
+            await job(db=session)
     except Exception as job_err:
-        logger.error(f"Hourly job execution failed. Error: {job_err}", exc_info=True)
-    finally:
-        try:
-            await session_gen.aclose()
-        except Exception as close_err:
-            logger.error(f"Error closing DB session for hourly job: {close_err}", exc_info=True)
-
-
-async def hourly_job_wrapper():
-    """Wrapper to get DB session for the hourly job."""
-    logger.info("Scheduler triggered hourly job...")
-    session_gen = get_db_session()  # Assumes this yields an AsyncSession
-    session: AsyncSession = await session_gen.__anext__()
-    try:
-        await process_and_save_hourly_news(db=session)
-    except Exception as job_err:
-        logger.error(f"Hourly job execution failed. Error: {job_err}", exc_info=True)
-    finally:
-        try:
-            await session_gen.aclose()
-        except Exception as close_err:
-            logger.error(f"Error closing DB session for hourly job: {close_err}", exc_info=True)
+        logger.error("Scheduled job %s failed. Error: %s", job.__name__, job_err, exc_info=True)
 
 
 # === Scheduler Setup ===
@@ -563,16 +530,21 @@ def add_jobs_to_scheduler(scheduler: AsyncIOScheduler):
             logger.error(f"Invalid timezone specified: {target_timezone_str}")
             return  # Or raise an error
 
+        # The timezone must be given to the trigger itself; add_job ignores trigger kwargs
+        # when it is handed a trigger instance. jitter spreads the start when several
+        # replicas run the scheduler, so they don't hit GNews/Gemini in the same second.
         scheduler.add_job(
-            gnews_hourly_job_wrapper,
-            trigger=CronTrigger(hour='7, 19', minute=past_minutes), # run every 12 hours
+            scheduled_job_wrapper,
+            args=[process_and_save_hourly_gnews],
+            trigger=CronTrigger(hour='7, 19', minute=past_minutes, timezone=tz, jitter=60), # run every 12 hours
             id='hourly_article_processing',
             name='Process Recent Articles Hourly',
             replace_existing=True,
             misfire_grace_time=600,  # Allow 10 minutes grace
-            timezone=target_timezone_str
+            coalesce=True,  # Collapse missed runs into one
+            max_instances=1  # Never overlap a run that is still going
         )
-        logger.info(f"Successfully added HOURLY article processing job (runs HH:{past_minutes} UTC).")
+        logger.info(f"Successfully added HOURLY article processing job (runs {past_minutes} past 7 and 19, {target_timezone_str}).")
     except Exception as e:
         logger.error(f"Could not add HOURLY job: {e}", exc_info=True)
 
@@ -1,84 +1,238 @@
 # --- Standard Library Imports ---
+import asyncio
+import itertools
 import logging
 import os
-import json
+import random
+import re
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Dict, Any, Optional, List, Set
+from typing import Annotated, Dict, Any, Optional, List, Set, Tuple
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
 import httpx
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import google.generativeai as genai
+from pydantic import TypeAdapter
+from google.api_core import exceptions as google_exceptions
 
 from app import config
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
-if not logger.hasHandlers():
-    # Configure basic logging if no handlers are configured elsewhere
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# --- Shared HTTP Client ---
+# One pooled client serves the article pages and the news list APIs, so connections and
+# TLS sessions are reused across fetches instead of being rebuilt for every call.
+_PAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # httpx decodes these transparently; br needs the Brotli package (see requirements.txt)
+    'Accept-Encoding': 'gzip, deflate, br',
+}
+_http_client: Optional[httpx.AsyncClient] = None
+# Only this much of a page is downloaded; the article body sits well within it, and the rest
+# of oversized pages is usually inline scripts and tracking payloads.
+_MAX_HTML_BYTES = 512 * 1024
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared news HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0, connect=10.0),
+            # Idle connections are kept for 30s (httpx default is 5s) so hosts repeated within a
+            # feed run reuse their TLS connection instead of handshaking again
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=20, keepalive_expiry=30),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Closes the shared news HTTP client. Called on application shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# --- Retries ---
+# Page fetches and Gemini calls are retried on throttling and transient failures, with
+# exponential backoff (1s, 2s, ... capped at 16s) plus jitter so parallel retries spread out.
+_RETRY_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 1.0
+_RETRY_MAX_DELAY = 16.0
+_RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+_GEMINI_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+async def _backoff(attempt: int) -> None:
+    """Sleeps before retry number `attempt` (1-based)."""
+    delay = min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+
+# Links that can never yield article text (media files, video and social hosts); fetching
+# them only wastes a round trip, so callers go straight to their description fallback.
+_SKIP_SUFFIXES = ('.pdf', '.mp4', '.mp3', '.jpg', '.jpeg', '.png', '.webp', '.gif')
+_SKIP_HOSTS = frozenset({'youtube.com', 'youtu.be', 'twitter.com', 'x.com', 'tiktok.com'})
+
+
+def is_article_url(link: str) -> bool:
+    """Cheap check that a link could point at an HTML article."""
+    parts = urlsplit(link)
+    if parts.path.lower().endswith(_SKIP_SUFFIXES):
+        return False
+    host = (parts.hostname or '').removeprefix('www.')
+    return not any(host == skip or host.endswith('.' + skip) for skip in _SKIP_HOSTS)
+
+
+# URL -> download in progress; entries are removed as soon as the download finishes
+_inflight_fetches: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+
+
+async def _fetch_page_content_once(client: httpx.AsyncClient, link: str) -> Optional[str]:
+    """One streamed GET of an article page; HTTP and transport errors propagate to the caller."""
+    logger.info("Attempting to fetch content from: %s", link)
+    # Streamed so non-HTML responses are dropped unread and large pages are cut off at _MAX_HTML_BYTES
+    async with client.stream('GET', link, headers=_PAGE_HEADERS) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('content-type', '').lower()
+        if 'html' not in content_type:
+            logger.warning("Fetched content from %s is not HTML (type: %s). Skipping.", link, content_type)
+            return None
+
+        chunks: List[bytes] = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= _MAX_HTML_BYTES:
+                logger.info("Content from %s truncated at %s bytes.", link, _MAX_HTML_BYTES)
+                break
+
+        logger.info("Successfully fetched HTML content from: %s", link)
+        return b"".join(chunks)[:_MAX_HTML_BYTES].decode(response.encoding or 'utf-8', errors='replace')
+
 
 async def fetch_page_content(link: str) -> Optional[str]:
     """
     Fetches the HTML content of a given URL.
     Returns the text content on success, None on failure.
+    Concurrent requests for the same URL share a single download.
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    timeout = httpx.Timeout(15.0, connect=10.0)
-    async with httpx.AsyncClient(headers=headers, timeout=timeout, follow_redirects=True) as client:
+    if not is_article_url(link):
+        logger.info("Skipping fetch for non-article link: %s", link)
+        return None
+
+    task = _inflight_fetches.get(link)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_page_content_with_retries(link))
+        _inflight_fetches[link] = task
+        task.add_done_callback(lambda _: _inflight_fetches.pop(link, None))
+    else:
+        logger.debug("Joining in-flight fetch for %s", link)
+    # shield: a cancelled caller must not cancel the download other callers are waiting on
+    return await asyncio.shield(task)
+
+
+async def _fetch_page_content_with_retries(link: str) -> Optional[str]:
+    """Throttling (429), gateway errors and transport failures are retried with backoff."""
+    client = get_http_client()
+    for attempt in range(1, _RETRY_ATTEMPTS + 1):
         try:
-            logger.info(f"Attempting to fetch content from: {link}")
-            response = await client.get(link)
-            response.raise_for_status()
-            content_type = response.headers.get('content-type', '').lower()
-            if 'html' in content_type:
-                logger.info(f"Successfully fetched HTML content from: {link}")
-                return response.text
-            else:
-                logger.warning(f"Fetched content from {link} is not HTML (type: {content_type}). Skipping.")
-                return None
+            return await _fetch_page_content_once(client, link)
         except httpx.HTTPStatusError as exc:
-            logger.error(f"HTTP error {exc.response.status_code} fetching {link}: {exc}")
+            if exc.response.status_code in _RETRYABLE_STATUS_CODES and attempt < _RETRY_ATTEMPTS:
+                logger.warning("HTTP error %s fetching %s; retrying (attempt %s of %s).",
+                               exc.response.status_code, link, attempt + 1, _RETRY_ATTEMPTS)
+                await _backoff(attempt)
+                continue
+            logger.error("HTTP error %s fetching %s: %s", exc.response.status_code, link, exc)
+            return None
+        except httpx.TransportError as exc:
+            if attempt < _RETRY_ATTEMPTS:
+                logger.warning("Transport error fetching %s (%s); retrying (attempt %s of %s).",
+                               link, exc, attempt + 1, _RETRY_ATTEMPTS)
+                await _backoff(attempt)
+                continue
+            logger.error("Request error fetching %s: %s", link, exc)
             return None
         except httpx.RequestError as exc:
-            logger.error(f"Request error fetching {link}: {exc}")
+            logger.error("Request error fetching %s: %s", link, exc)
             return None
         except Exception as exc:
-            logger.error(f"Unexpected error fetching {link}: {exc}", exc_info=True)
+            logger.error("Unexpected error fetching %s: %s", link, exc, exc_info=True)
             return None
+    return None
+
+
+_MIN_HTML_CHARS = 2000
+_MIN_P_TAGS = 3
+_P_TAG_RE = re.compile(r'<p[\s>]', re.IGNORECASE)
+# Extracted text sent to Gemini is capped here (roughly 3k tokens); the opening of a news
+# article carries its key points, and later paragraphs are mostly related links and comments.
+_MAX_ARTICLE_CHARS = 12000
+# Non-breaking spaces become plain spaces and zero-width characters are dropped, in one pass
+_TEXT_CLEANUP_TABLE = str.maketrans({'\xa0': ' ', '\u200b': None, '\ufeff': None})
+
+
+def _may_contain_article(html_content: str) -> bool:
+    """Cheap pre-parse check: enough markup and at least a few <p> tags."""
+    if len(html_content) < _MIN_HTML_CHARS:
+        return False
+    p_tags = itertools.islice(_P_TAG_RE.finditer(html_content), _MIN_P_TAGS)
+    return sum(1 for _ in p_tags) >= _MIN_P_TAGS
 
 
 def extract_text_from_html(html_content: str) -> str:
     """
-    Extracts meaningful text content from HTML using BeautifulSoup.
+    Extracts meaningful text content from HTML using selectolax.
+    Parsing and tree building happen in C, so no Python object is created per node.
     """
     if not html_content: return ""
+    # Tiny responses and JS-rendered shells with almost no <p> tags never yield usable text;
+    # skip building a tree for them so the caller falls back to the description right away.
+    if not _may_contain_article(html_content):
+        return ""
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        for script_or_style in soup(["script", "style"]):
+        tree = LexborHTMLParser(html_content)
+        for script_or_style in tree.css('script, style'):
             script_or_style.decompose()
-        main_content = soup.find('article') or soup.find('main') or soup.find(role='main')
-        paragraphs = main_content.find_all('p') if main_content else soup.find_all('p')
-        text_parts = [para.get_text(strip=True) for para in paragraphs]
-        full_text = "\n".join(part for part in text_parts if part)
-        full_text = full_text.replace('\xa0', ' ')
+        main_content = tree.css_first('article') or tree.css_first('main') or tree.css_first('[role=main]')
+        root = main_content or tree.body or tree.root
+        if root is None:
+            return ""
+        text_parts: List[str] = []
+        total_chars = 0
+        for para in root.css('p'):
+            part = para.text(strip=True)
+            if not part:
+                continue
+            text_parts.append(part)
+            total_chars += len(part) + 1
+            if total_chars >= _MAX_ARTICLE_CHARS:
+                break
+        full_text = "\n".join(text_parts)[:_MAX_ARTICLE_CHARS]
+        full_text = full_text.translate(_TEXT_CLEANUP_TABLE)
         return full_text.strip()
     except Exception as e:
-        logger.error(f"Error parsing HTML with BeautifulSoup: {e}", exc_info=True)
+        logger.error(f"Error parsing HTML with selectolax: {e}", exc_info=True)
         return ""
 
 
-async def generate_summary_from_text(text_content: str, title: Optional[str] = None, description: Optional[str] = None) -> Optional[str]:
-    """
-    Uses Gemini to generate a summary for the provided text content.
-    """
-    if not text_content or not text_content.strip():
-        logger.warning("Cannot generate summary: Input text content is empty.")
-        return None
+# --- Gemini Model & Prompt ---
+# The model object is built once and reused for every summary request; the static part of
+# the per-article prompt is a module constant so each call only formats the article fields.
+_gemini_model: Optional[genai.GenerativeModel] = None
 
-    prompt = f""" Please provide a concise and neutral summary (around 100 - 250 words) of the following news article 
+_SUMMARY_PROMPT_PREFIX = """ Please provide a concise and neutral summary (around 100 - 250 words) of the following news article 
     content. Focus on the main points and key information presented in the text. If the text is about promotion or 
     advertise paywall block etc, and not related to the news, which means we fetch the wrong information, you need to 
     provide the description instead. 
@@ -87,7 +241,9 @@ async def generate_summary_from_text(text_content: str, title: Optional[str] = N
     introductory text, explanations, markdown formatting (like ```json), or code fences before or after the JSON 
     structure itself. The entire response must be only the summary.
 
-    Article Title (for context, if available): {title if title else 'N/A'}
+"""
+
+_SUMMARY_ARTICLE_TEMPLATE = """    Article Title (for context, if available): {title}
     
     Article Description: {description}
 
@@ -96,14 +252,133 @@ async def generate_summary_from_text(text_content: str, title: Optional[str] = N
     {text_content}
     ---
     """
+
+
+# Batched prompts keep the same instructions first so the prompt prefix is identical across calls;
+# only the article count and the per-article blocks vary.
+_BATCH_PROMPT_PREFIX = """ Please provide a concise and neutral summary (around 100 - 250 words) of each of the following 
+    news articles. Focus on the main points and key information presented in each text. If an article's 
+    text is about promotion or advertise paywall block etc, and not related to the news, which means we fetch the 
+    wrong information, you need to provide its description instead. 
+    
+    **Important:** Respond with ONLY a JSON array with exactly one string per article, where element i is the summary 
+    of Article i+1, in the same order as below. Do not include any introductory text, explanations or code fences.
+"""
+
+_BATCH_ARTICLE_TEMPLATE = """
+    Article {index}
+    Article Title (for context, if available): {title}
+    Article Description: {description}
+    Article Content to Summarize:
+    ---
+    {text_content}
+    ---"""
+
+
+def _get_gemini_model() -> genai.GenerativeModel:
+    """Returns the shared Gemini model for config.GEMINI_MODEL_NAME, creating it on first use."""
+    global _gemini_model
+    if _gemini_model is None:
+        _gemini_model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
+    return _gemini_model
+
+
+# Batched calls use structured output: Gemini is constrained to a JSON array of strings,
+# which is parsed and type-checked in one step by the adapter.
+_BATCH_GENERATION_CONFIG = {'response_mime_type': 'application/json', 'response_schema': list[str]}
+_SUMMARIES_ADAPTER = TypeAdapter(List[str])
+
+# Caps in-flight Gemini requests across both feeds, independently of how many pages are being fetched
+_gemini_semaphore = asyncio.Semaphore(config.GEMINI_MAX_CONCURRENCY)
+
+
+async def _generate_content(prompt: str, **kwargs: Any):
+    """Calls Gemini under the shared concurrency cap, retrying rate-limit and transient server errors."""
+    model = _get_gemini_model()
+    for attempt in range(1, _RETRY_ATTEMPTS + 1):
+        try:
+            async with _gemini_semaphore:
+                return await model.generate_content_async(prompt, **kwargs)
+        except _GEMINI_RETRYABLE_ERRORS as e:
+            if attempt == _RETRY_ATTEMPTS:
+                raise
+            logger.warning("Gemini call failed (%s); retrying (attempt %s of %s).", e, attempt + 1, _RETRY_ATTEMPTS)
+            await _backoff(attempt)
+
+
+async def generate_summary_from_text(text_content: str, title: Optional[str] = None, description: Optional[str] = None) -> Optional[str]:
+    """
+    Uses Gemini to generate a summary for the provided text content.
+    """
+    if not text_content or not text_content.strip():
+        logger.warning("Cannot generate summary: Input text content is empty.")
+        return None
+
+    prompt = _SUMMARY_PROMPT_PREFIX + _SUMMARY_ARTICLE_TEMPLATE.format(
+        title=title if title else 'N/A', description=description, text_content=text_content)
     try:
-        logger.info(f"Generating summary with Gemini for article: {title if title else 'N/A'}")
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        response = await model.generate_content_async(prompt, request_options={'timeout': 120})
+        logger.info("Generating summary with Gemini for article: %s", title if title else 'N/A')
+        response = await _generate_content(prompt, request_options={'timeout': 120})
         summary = response.text.strip()
-        logger.info(f"Successfully generated summary for: {title if title else 'N/A'}")
+        logger.info("Successfully generated summary for: %s", title if title else 'N/A')
         return summary
     except Exception as e:
-        logger.error(f"Error calling Gemini API for summary generation (article: {title if title else 'N/A'}): {e}",
-                     exc_info=True)
+        logger.error(
+            "Error calling Gemini API for summary generation (article: %s): %s",
+            title if title else 'N/A', e, exc_info=True)
         return None
+
+
+async def generate_summaries_batch(items: List[Tuple[str, Optional[str], Optional[str]]]) -> List[Optional[str]]:
+    """
+    Uses one Gemini call to summarize several articles, given as (text_content, title, description).
+    Returns summaries in the same order, None where none was produced. Falls back to one call per
+    article if the batched response is not a JSON array of the expected length.
+    """
+    if not items:
+        return []
+    if len(items) == 1:
+        text_content, title, description = items[0]
+        return [await generate_summary_from_text(text_content, title, description)]
+
+    articles_block = "\n".join(
+        _BATCH_ARTICLE_TEMPLATE.format(
+            index=index, title=title if title else 'N/A', description=description, text_content=text_content)
+        for index, (text_content, title, description) in enumerate(items, start=1)
+    )
+    prompt = f"{_BATCH_PROMPT_PREFIX}    There are {len(items)} articles.\n{articles_block}\n    "
+    try:
+        logger.info("Generating %s summaries with one Gemini call.", len(items))
+        response = await _generate_content(
+            prompt,
+            generation_config=_BATCH_GENERATION_CONFIG,
+            request_options={'timeout': 180},
+        )
+        summaries = _SUMMARIES_ADAPTER.validate_json(response.text)
+        if len(summaries) != len(items):
+            raise ValueError(f"expected a JSON array of {len(items)} summaries")
+        return [summary.strip() or None for summary in summaries]
+    except Exception as e:
+        logger.warning(
+            "Batched Gemini summary generation failed (%s); summarizing the %s articles one by one.",
+            e, len(items))
+        return list(await asyncio.gather(
+            *(generate_summary_from_text(text_content, title, description) for text_content, title, description in items)
+        ))
+
+
+async def summarize_articles(items: List[Tuple[str, Optional[str], Optional[str]]],
+                             semaphore: asyncio.Semaphore) -> List[Optional[str]]:
+    """
+    Summarizes (text_content, title, description) items in groups of config.SUMMARY_BATCH_SIZE,
+    running at most as many Gemini calls at once as the semaphore allows. Keeps the input order.
+    """
+    batch_size = max(1, config.SUMMARY_BATCH_SIZE)
+
+    async def _summarize_batch(batch: List[Tuple[str, Optional[str], Optional[str]]]) -> List[Optional[str]]:
+        async with semaphore:
+            return await generate_summaries_batch(batch)
+
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    results = await asyncio.gather(*(_summarize_batch(batch) for batch in batches))
+    return [summary for batch_summaries in results for summary in batch_summaries]
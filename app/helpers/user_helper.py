@@ -1,23 +1,29 @@
+from sqlalchemy import bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select  # Use select for async queries
 from sqlalchemy.orm import selectinload  # If needed for relationships later
-import random
-import string
+import secrets
 import uuid # Add uuid import
 
 from . import auth_helper  # Import necessary modules
 from ..models import user, models
 
+# Lookup statements are built once; each call only binds the value, and SQLAlchemy reuses
+# the cached compiled SQL (and asyncpg its prepared statement) for every execution.
+_USER_BY_EMAIL = select(models.User).where(models.User.email == bindparam("email"))
+_USER_BY_ID = select(models.User).where(models.User.user_id == bindparam("user_id"))
+_USER_BY_APPLE_ID = select(models.User).where(models.User.apple_user_id == bindparam("apple_id"))
+
 
 async def get_user_by_email(db: AsyncSession, email: str) -> models.User | None:
     """Fetches a user from the database by email."""
-    result = await db.execute(select(models.User).where(models.User.email == email))
+    result = await db.execute(_USER_BY_EMAIL, {"email": email})
     return result.scalar_one_or_none()
 
 
 async def get_user_by_id(db: AsyncSession, user_id: uuid.UUID) -> models.User | None:
     """Fetches a user from the database by their UUID."""
-    result = await db.execute(select(models.User).where(models.User.user_id == user_id))
+    result = await db.execute(_USER_BY_ID, {"user_id": user_id})
     return result.scalar_one_or_none()
 
 
@@ -32,8 +38,8 @@ async def create_db_user(db: AsyncSession, user: user.EmailSignupRequest) -> mod
     )
     # Add to session and commit
     db.add(db_user)
-    # NOTE: If username collision occurs, flush() will raise IntegrityError
-    # The transaction rollback is handled by the get_db_session dependency.
+    # NOTE: username is not unique in the schema, so only a duplicate email can make flush() raise
+    # IntegrityError. The transaction rollback is handled by the get_db_session dependency.
     await db.flush() 
     await db.refresh(db_user)
     return db_user
@@ -41,16 +47,13 @@ async def create_db_user(db: AsyncSession, user: user.EmailSignupRequest) -> mod
 
 async def get_user_by_apple_id(db: AsyncSession, apple_id: str) -> models.User | None:
     """Fetches a user from the database by their Apple User ID."""
-    result = await db.execute(
-        select(models.User).where(models.User.apple_user_id == apple_id)
-    )
+    result = await db.execute(_USER_BY_APPLE_ID, {"apple_id": apple_id})
     return result.scalar_one_or_none()
 
 
 def generate_random_username() -> str:
-    """Generates a username like 'user123456'."""
-    digits = "".join(random.choices(string.digits, k=6))
-    return f"user{digits}"
+    """Generates a username like 'user3f9a0c12de' (40 random bits, so repeats are practically impossible)."""
+    return f"user{secrets.token_hex(5)}"
 
 # Add CRUD functions for Summaries here later if needed
 # e.g., get_summary_by_date_period, create_summary, etc.
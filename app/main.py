@@ -1,8 +1,10 @@
 import logging
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from .routers import auth_router, summary_router
+from .helpers import apple_auth_helper, summary_utils
 from .helpers.summary_helper import lifespan
 
 # --- Add this logging configuration near the start of your app ---
@@ -21,7 +23,16 @@ root_logger.addHandler(console_handler)
 root_logger.setLevel(logging.INFO) # Set root logger level to INFO
 # --- End of logging configuration ---
 
-app = FastAPI(lifespan=lifespan)
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    """Runs the scheduler lifespan and closes shared HTTP clients on shutdown."""
+    async with lifespan(app):
+        yield
+    await apple_auth_helper.close_client()
+    await summary_utils.close_http_client()
+
+
+app = FastAPI(lifespan=app_lifespan)
 
 app.include_router(auth_router.router)
 app.include_router(summary_router.router)
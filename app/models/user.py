@@ -88,12 +88,6 @@ class TokenData(BaseModel):
     token_type: str
 
 
-# Properties stored inside the JWT token payload
-class TokenPayload(BaseModel):
-    user_id: uuid.UUID
-    email: Optional[EmailStr] = None
-
-
 class EmailSignupRequest(BaseModel):
     email: EmailStr
     password: str = Field(min_length=8)
@@ -53,8 +53,9 @@ async def email_signup(
 
         # 2. Generate JWT Token
         access_token_expires = timedelta(minutes=auth_helper.ACCESS_TOKEN_EXPIRE_MINUTES)
+        # Use USER_ID as the token subject, matching signin and get_current_user
         access_token = auth_helper.create_access_token(
-            data={"sub": created_user.email}, expires_delta=access_token_expires
+            data={"sub": str(created_user.user_id)}, expires_delta=access_token_expires
         )
         logger.info(f"Token generated for new user: {created_user.email}")
 
@@ -121,7 +122,7 @@ async def email_signin(
 ):
     try:
         existing_user = await user_helper.get_user_by_email(db, signin_request.email)
-        logger.info(f"User found in signin is {existing_user}")
+        logger.debug("User found in signin is %s", existing_user)
         if not existing_user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -208,6 +209,7 @@ async def sign_in_with_apple(
                 logger.info(f"Updating Apple refresh token for user {existing_user.user_id}")
                 existing_user.apple_refresh_token = apple_refresh_token
                 db.add(existing_user) # Mark for update
+                auth_helper.invalidate_cached_user(existing_user.user_id)
             user_to_return = existing_user
         else:
             # --- User Not Found (Sign Up) ---
@@ -237,8 +239,8 @@ async def sign_in_with_apple(
                 is_active=True
             )
             db.add(new_user_data)
-            # NOTE: If username collision occurs, flush() will raise IntegrityError
-            # The transaction rollback is handled by the get_db_session dependency.
+            # NOTE: username is not unique in the schema, so only a duplicate email or Apple ID can make
+            # flush() raise IntegrityError. The transaction rollback is handled by the get_db_session dependency.
             await db.flush()
             await db.refresh(new_user_data)
             logger.info(f"New user created with User ID: {new_user_data.user_id}, Username: {generated_username} for Apple ID.")
@@ -0,0 +1,62 @@
+import os
+import unittest
+import uuid
+
+# app.config reads the environment at import time; point the app at a throwaway local database.
+os.environ.setdefault("ENVIRONMENT", "local")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.helpers import auth_helper
+from app.models import User
+
+
+class CurrentUserCacheTest(unittest.IsolatedAsyncioTestCase):
+    """get_current_user must keep working on a cache hit after the filling request rolled back."""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(User.__table__.create)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+
+        self.user_id = uuid.uuid4()
+        async with self.session_factory.begin() as session:
+            session.add(User(user_id=self.user_id, username="user0123456789", email="a@example.com"))
+        self.token = auth_helper.create_access_token({"sub": str(self.user_id)})
+        auth_helper._user_cache.clear()
+
+    async def asyncTearDown(self):
+        auth_helper._user_cache.clear()
+        await self.engine.dispose()
+
+    async def test_cache_hit_after_rollback(self):
+        # First request fills the cache, then fails after auth, so session.begin() rolls back
+        with self.assertRaises(RuntimeError):
+            async with self.session_factory.begin() as session:
+                user = await auth_helper.get_current_user(self.token, session)
+                self.assertEqual(user.user_id, self.user_id)
+                raise RuntimeError("request failed after auth")
+        self.assertIn(self.user_id, auth_helper._user_cache)
+
+        # Second request is served from the cache and must get a fully loaded user
+        async with self.session_factory.begin() as session:
+            user = await auth_helper.get_current_user(self.token, session)
+            active_user = await auth_helper.get_current_active_user(user)
+            self.assertIs(active_user, user)
+            self.assertIn(user, session)
+            self.assertEqual(user.user_id, self.user_id)
+            self.assertEqual(user.email, "a@example.com")
+            self.assertEqual(user.username, "user0123456789")
+
+    async def test_cache_hit_does_not_share_instances(self):
+        async with self.session_factory.begin() as session:
+            first = await auth_helper.get_current_user(self.token, session)
+        async with self.session_factory.begin() as session:
+            second = await auth_helper.get_current_user(self.token, session)
+        self.assertIsNot(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()